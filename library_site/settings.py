@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,6 +66,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'main.context_processors.role',
             ],
         },
     },
@@ -157,6 +159,69 @@ MESSAGE_TAGS = {
 
 LOGOUT_REDIRECT_URL = 'login'
 
+# Local-memory cache needs no external service. With several worker
+# processes, switch to django.core.cache.backends.filebased.FileBasedCache
+# so card versions and counters are shared between them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library-site',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+}
+
+# Rendered book cards are keyed by the book's updated_at, so they can live long
+BOOK_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# The student dashboard summary is versioned the same way and also keyed by
+# the date; loans due within DUE_SOON_DAYS are flagged on it
+STUDENT_SUMMARY_CACHE_TIMEOUT = 60 * 60 * 24
+DUE_SOON_DAYS = 3
+
+# Follow-up work such as reservation promotion: 'thread' runs it on a small
+# in-process pool after the response, 'sync' inline, 'off' leaves it to the
+# process_reservations command (run it from cron or as a worker with --loop).
+BACKGROUND_TASKS = 'thread'
+BACKGROUND_TASK_WORKERS = 2
+
+# Catalog listing: books per page, and the largest ?size= a client may ask for
+CATALOG_PAGE_SIZE = 24
+CATALOG_MAX_PAGE_SIZE = 96
+
+# Loans shown per page of a book's borrow history
+BORROW_HISTORY_PAGE_SIZE = 20
+
+# Loans per page of the student dashboard history
+STUDENT_HISTORY_PAGE_SIZE = 20
+
+# Rows per page of the librarian borrowed-books list, overdue report,
+# metadata review queue and student directory
+BORROWED_BOOKS_PAGE_SIZE = 50
+OVERDUE_PAGE_SIZE = 50
+METADATA_REVIEW_PAGE_SIZE = 50
+STUDENT_DIRECTORY_PAGE_SIZE = 50
+
+# Where import_books and Book.clean get book metadata: a dotted path to a
+# callable taking an ISBN (see main/metadata.py), and the isbnlib service it
+# queries. Without network access, set METADATA_PROVIDER=main.dumps.provider
+# and METADATA_DUMP to a JSONL/CSV catalog dump (see main/dumps.py).
+METADATA_PROVIDER = os.environ.get('METADATA_PROVIDER', 'main.metadata.isbnlib_provider')
+METADATA_SERVICE = 'default'
+METADATA_DUMP = os.environ.get('METADATA_DUMP', BASE_DIR / 'metadata_dump.jsonl')
+
+# Metadata cache (IsbnMetadata table): seconds an answer stays fresh, and
+# how long "no metadata" is believed; per-process LRU entries in front of it
+METADATA_CACHE_TTL = 60 * 60 * 24 * 30
+METADATA_CACHE_NEGATIVE_TTL = 60 * 60 * 24
+METADATA_CACHE_LRU_SIZE = 5000
+
+# Overdue notices (manage.py sweep_overdue). The console backend needs no
+# mail server; point EMAIL_BACKEND at the SMTP backend in production, or at
+# django.core.mail.backends.filebased.EmailBackend to keep copies on disk.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = 'library@kennesaw.edu'
+
 # --- Platform.sh settings ---
 from platformshconfig import Config
 from pathlib import Path
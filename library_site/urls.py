@@ -18,10 +18,11 @@ from django.contrib import admin
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from main.views import (
-    view_books, view_students, view_book, new_book, index,
+    view_books, search_books, view_students, view_book, new_book, index,
     borrow, return_book, change_student_profile, change_librarian_profile,
     librarian_borrowed_books, librarian_add_book, librarian_remove_book,
-    register, CustomLoginView, librarian_dashboard, student_dashboard
+    register, CustomLoginView, librarian_dashboard, student_dashboard,
+    cache_stats, librarian_circulation, librarian_overdue, librarian_metadata_review
 )
 from django.conf import settings
 from django.conf.urls.static import static
@@ -42,6 +43,7 @@ urlpatterns = [
     path('', index, name='index'),
     path('admin/', admin.site.urls),
     path('books/', view_books, name='books'),
+    path('books/search/', search_books, name='book_search'),
     path('book/<int:book_id>/', view_book, name='book'),
 
     # Student actions
@@ -58,6 +60,10 @@ urlpatterns = [
     path('librarian/remove_book/', librarian_remove_book, name='librarian_remove_book'),
     path('librarian/profile/change/', change_librarian_profile, name='librarian_profile_change'),
     path('librarian/dashboard/', librarian_dashboard, name='librarian_dashboard'),
+    path('librarian/circulation/', librarian_circulation, name='librarian_circulation'),
+    path('librarian/overdue/', librarian_overdue, name='librarian_overdue'),
+    path('librarian/metadata-review/', librarian_metadata_review, name='librarian_metadata_review'),
+    path('librarian/cache-stats/', cache_stats, name='cache_stats'),
 ]
 
 #The media fix
@@ -1,8 +1,23 @@
 from django.contrib import admin
-from .models import Student, Book, Borrow, Reservation, Librarian
+from .isbn import to_isbn13
+from .models import Student, Book, Borrow, Reservation, Librarian, OverdueNotice, IsbnMetadata
 # Register your models here.
 admin.site.register(Student)
-admin.site.register(Book)
+
+@admin.register(Book)
+class BookAdmin(admin.ModelAdmin):
+    list_display = ('title', 'author', 'isbn', 'quantity', 'metadata_status')
+    list_filter = ('metadata_status', 'language')
+    search_fields = ('title', 'author')
+
+    def get_search_results(self, request, queryset, search_term):
+        # an ISBN in any spelling is one probe of the isbn13 index
+        if to_isbn13(search_term):
+            return queryset.by_isbn(search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
 admin.site.register(Borrow)
 admin.site.register(Reservation)
-admin.site.register(Librarian)
\ No newline at end of file
+admin.site.register(Librarian)
+admin.site.register(OverdueNotice)
+admin.site.register(IsbnMetadata)
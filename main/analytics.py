@@ -0,0 +1,180 @@
+import datetime
+from collections import Counter
+from itertools import islice
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.utils import timezone
+
+from .models import Book, Borrow, DailyCirculation, JobCheckpoint, Student, UTCDate
+
+# Circulation analytics for the librarian dashboard. rollup() turns Borrow
+# rows into DailyCirculation counts one chunk of UTC days at a time,
+# replacing the chunk's rows and moving a JobCheckpoint forward in the same
+# transaction, so a backfill of years of loans can stop and resume. Days
+# before the checkpoint are final: a loan only ever changes on the day it
+# is borrowed or returned, so each run recomputes from the checkpoint (at
+# most yesterday) up to today. summary() reads nothing but the rollups.
+
+ROLLUP_JOB = 'circulation-rollup'
+WINDOWS = (7, 30, 90, 365)
+TOP_TITLES = 10
+CHUNK_SIZE = 50000
+
+
+def _start_of(day):
+    return datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+
+
+def _ordinals(days, default):
+    return np.fromiter((d.toordinal() if d else default for d in days), dtype=np.int64, count=len(days))
+
+
+def _out_and_overdue(start, end):
+    """
+    Loans still out (and overdue) at the end of each day in [start, end),
+    per student year: ``{year: (out, overdue)}`` arrays indexed by day.
+    """
+    first, last = start.toordinal(), end.toordinal()
+    loans = (
+        Borrow.objects
+        .filter(borrowed_at__lt=_start_of(end))
+        .filter(Q(returned_at__isnull=True) | Q(returned_at__gte=_start_of(start + datetime.timedelta(days=1))))
+        .values_list(UTCDate('borrowed_at'), UTCDate('returned_at'), UTCDate('returned_due_date'), 'student__year')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    years = {}
+    read = 0
+    while chunk := list(islice(loans, CHUNK_SIZE)):
+        read += len(chunk)
+        borrowed, returned, due, year = zip(*chunk)
+        # out at the end of day D: borrowed on or before D, returned after it;
+        # overdue as well once D is past the due date (Borrow.calculate_late_fee)
+        lo = np.maximum(_ordinals(borrowed, 0), first)
+        hi = np.minimum(_ordinals(returned, last), last)
+        late = np.maximum(lo, _ordinals(due, 0) + 1)
+        for value in set(year):
+            mask = np.array(year) == value
+            diff = years.setdefault(value, np.zeros((2, last - first + 1), dtype=np.int64))
+            for row, begin in ((0, lo), (1, late)):
+                keep = mask & (begin < hi)
+                np.add.at(diff[row], begin[keep] - first, 1)
+                np.add.at(diff[row], hi[keep] - first, -1)
+    return {value: np.cumsum(diff, axis=1)[:, :-1] for value, diff in years.items()}, read
+
+
+def rollup_rows(start, end):
+    """DailyCirculation rows for the days ``start <= day < end``."""
+    counts = Counter()
+    span = (_start_of(start), _start_of(end))
+
+    borrowed = (
+        Borrow.objects.filter(borrowed_at__gte=span[0], borrowed_at__lt=span[1])
+        .values('book_id', 'book__language', 'student__year', day=UTCDate('borrowed_at'))
+        .annotate(n=Count('pk')).order_by()
+    )
+    for row in borrowed:
+        for dimension, value in (('all', ''), ('book', row['book_id']), ('language', row['book__language']),
+                                 ('year', row['student__year'])):
+            counts[row['day'], dimension, str(value), 'loans'] += row['n']
+
+    returned = (
+        Borrow.objects.filter(returned_at__gte=span[0], returned_at__lt=span[1])
+        .values(day=UTCDate('returned_at')).annotate(n=Count('pk')).order_by()
+    )
+    for row in returned:
+        counts[row['day'], 'all', '', 'returns'] += row['n']
+
+    snapshots, read = _out_and_overdue(start, end)
+    for value, (out, overdue) in snapshots.items():
+        for offset in np.flatnonzero(out):
+            day = start + datetime.timedelta(days=int(offset))
+            for field, series in (('out', out), ('overdue', overdue)):
+                counts[day, 'year', value, field] += int(series[offset])
+                counts[day, 'all', '', field] += int(series[offset])
+
+    rows = {}
+    for day in (start + datetime.timedelta(days=n) for n in range((end - start).days)):
+        rows[day, 'all', ''] = DailyCirculation(day=day, dimension='all', value='')
+    for (day, dimension, value, field), n in counts.items():
+        if (day, dimension, value) not in rows:
+            rows[day, dimension, value] = DailyCirculation(day=day, dimension=dimension, value=value)
+        setattr(rows[day, dimension, value], field, n)
+    return list(rows.values()), read
+
+
+def rollup(now=None, chunk_days=31, since=None, restart=False, progress=None):
+    """
+    Bring the rollups up to date through today, ``chunk_days`` at a time.
+    ``since`` recomputes from that day (after editing old loans);
+    ``restart`` from the first loan ever made.
+    """
+    today = (now or timezone.now()).astimezone(datetime.timezone.utc).date()
+    first = Borrow.objects.aggregate(first=Min(UTCDate('borrowed_at')))['first'] or today
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=ROLLUP_JOB, defaults={'run_date': first})
+    start = first if restart else min(since, checkpoint.run_date) if since else checkpoint.run_date
+    start = max(start, first)
+    checkpoint.processed = 0
+
+    while start <= today:
+        end = min(start + datetime.timedelta(days=chunk_days), today + datetime.timedelta(days=1))
+        rows, read = rollup_rows(start, end)
+        with transaction.atomic():
+            DailyCirculation.objects.filter(day__gte=start, day__lt=end).delete()
+            DailyCirculation.objects.bulk_create(rows, batch_size=1000)
+            # today is still changing, so it is never final
+            checkpoint.run_date = min(end, today)
+            checkpoint.processed += read
+            checkpoint.finished = end > today
+            checkpoint.save()
+        if progress:
+            progress(checkpoint, start, end)
+        start = end
+    return checkpoint
+
+
+def summary(days=30, now=None):
+    """Dashboard figures for the last ``days`` days, from the rollups only."""
+    today = (now or timezone.now()).astimezone(datetime.timezone.utc).date()
+    rows = DailyCirculation.objects.filter(day__gt=today - datetime.timedelta(days=days), day__lte=today)
+
+    per_day = list(rows.filter(dimension='all').order_by('day').values('day', 'loans', 'returns', 'out', 'overdue'))
+    top = list(
+        rows.filter(dimension='book').values('value')
+            .annotate(loans=Sum('loans')).order_by('-loans', 'value')[:TOP_TITLES]
+    )
+    titles = dict(Book.objects.filter(pk__in=[int(t['value']) for t in top]).values_list('pk', 'title'))
+    for title in top:
+        title['book_id'] = int(title['value'])
+        title['title'] = titles.get(title['book_id'], '(removed)')
+
+    year_labels = dict(Student.YEAR_CHOICES)
+    by_year = list(
+        rows.filter(dimension='year').values('value')
+            .annotate(loans=Sum('loans'), out=Sum('out'), overdue=Sum('overdue')).order_by('value')
+    )
+    for year in by_year:
+        year['label'] = year_labels.get(year['value'], 'Not given')
+        # share of loan-days spent overdue over the window
+        year['overdue_rate'] = 100 * year['overdue'] / year['out'] if year['out'] else 0
+
+    languages = dict(Book.LANGUAGE_CHOICES)
+    by_language = list(
+        rows.filter(dimension='language').values('value')
+            .annotate(loans=Sum('loans')).order_by('-loans', 'value')
+    )
+    for language in by_language:
+        language['label'] = languages.get(language['value'], language['value'])
+
+    checkpoint = JobCheckpoint.objects.filter(name=ROLLUP_JOB).first()
+    return {
+        'days': days,
+        'per_day': per_day,
+        'max_per_day': max([max(d['loans'], d['returns']) for d in per_day] or [0]),
+        'loans': sum(d['loans'] for d in per_day),
+        'returns': sum(d['returns'] for d in per_day),
+        'top_titles': top,
+        'by_year': by_year,
+        'by_language': by_language,
+        'updated_at': checkpoint.updated_at if checkpoint else None,
+    }
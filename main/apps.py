@@ -1,7 +1,27 @@
 # main/apps.py
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    # Later migrations can rebuild main_book (or main_student) on SQLite and
+    # drop the FTS triggers or prefix indexes with it; put them back once
+    # migrations are done.
+    from django.db import connections
+    from . import directory, search
+    connection = connections[using]
+    # post_migrate also fires when only other apps were migrated
+    tables = connection.introspection.table_names()
+    if 'main_book' in tables:
+        search.install(connection)
+    if 'main_student' in tables:
+        directory.install(connection)
+
 
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
 
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(ensure_search_index, sender=self)
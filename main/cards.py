@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+# Rendered book cards are cached under the book's updated_at, which every
+# write to a book moves forward (save(), the circulation UPDATEs, bulk
+# imports). The key therefore comes from the database row the page just
+# read, so a card changed by any process is re-rendered on the next page
+# view in every other one; the old entry is simply never asked for again.
+
+CARD_KEY    = 'book:{}:card:{}'
+HITS_KEY    = 'book-card:hits'
+MISSES_KEY  = 'book-card:misses'
+
+
+def _count(key, amount):
+    if amount:
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.add(key, 0, None)
+            cache.incr(key, amount)
+
+
+def render_cards(books):
+    """Return the card HTML for ``books``, rendering only cache misses."""
+    books = list(books)
+    keys = [CARD_KEY.format(book.pk, book.updated_at.isoformat()) for book in books]
+    cached = cache.get_many(keys)
+
+    rendered = {}
+    cards = []
+    for book, key in zip(books, keys):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string('book_card.html', {'book': book})
+            rendered[key] = html
+        cards.append(mark_safe(html))
+
+    if rendered:
+        cache.set_many(rendered, settings.BOOK_CARD_CACHE_TIMEOUT)
+    _count(HITS_KEY, len(books) - len(rendered))
+    _count(MISSES_KEY, len(rendered))
+    return cards
+
+
+def stats():
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
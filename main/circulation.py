@@ -0,0 +1,179 @@
+import datetime
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import dashboard, reservations
+from .isbn import to_isbn13
+from .models import LOAN_DAYS, Book, Borrow, Reservation, books_updated
+
+# Desk circulation: check a whole stack of books in or out for one student
+# in a single transaction, with a fixed number of queries however many
+# items are scanned. Items are book ids or ISBNs; every item gets its own
+# result so the desk can see exactly which scans failed and why.
+
+
+class _Raced(Exception):
+    """Availability changed between the check and the update."""
+
+
+def _result(identifier, book=None, ok=False, message=''):
+    return {
+        'item': identifier,
+        'book_id': book.pk if book else None,
+        'title': book.title if book else None,
+        'ok': ok,
+        'message': message,
+    }
+
+
+def _resolve(identifiers, lock=False):
+    """Map each scanned identifier to its Book with one query."""
+    cleaned = [str(i).strip() for i in identifiers]
+    isbns = [to_isbn13(i) for i in cleaned]
+    ids = {int(i) for i, isbn in zip(cleaned, isbns) if not isbn and i.isdigit()}
+    books = Book.objects.filter(Q(isbn13__in=set(isbns) - {None}) | Q(pk__in=ids)).only(
+        'id', 'title', 'isbn', 'isbn13', 'quantity'
+    )
+    if lock:
+        books = books.select_for_update()
+    by_isbn, by_id = {}, {}
+    for book in books:
+        by_isbn[book.isbn13] = book
+        by_id[book.pk] = book
+    return [
+        by_isbn.get(isbn) if isbn else by_id.get(int(i)) if i.isdigit() else None
+        for i, isbn in zip(cleaned, isbns)
+    ]
+
+
+def bulk_checkout(student, identifiers):
+    """Lend every listed book to ``student``; returns one result per item."""
+    try:
+        return _bulk_checkout(student, identifiers)
+    except _Raced:
+        # Only reachable on backends without row locks: fall back to the
+        # one-at-a-time path, which is slower but never oversubscribes.
+        return [_checkout_one(student, identifier) for identifier in identifiers]
+
+
+def _bulk_checkout(student, identifiers):
+    now = timezone.now()
+    due = now + datetime.timedelta(days=LOAN_DAYS)
+    with transaction.atomic():
+        books = _resolve(identifiers, lock=connection.features.has_select_for_update)
+        already = set(Borrow.objects.filter(
+            student=student, returned_at__isnull=True,
+            book__in=[b for b in books if b],
+        ).values_list('book_id', flat=True))
+        held = reservations.held_for_others([b.pk for b in books if b and b.quantity], student)
+
+        results, eligible = [], []
+        for identifier, book in zip(identifiers, books):
+            if book is None:
+                results.append(_result(identifier, message="No book with that id or ISBN."))
+            elif book.pk in already:
+                results.append(_result(identifier, book, message="Already borrowed by this student."))
+            elif book.quantity == 0:
+                results.append(_result(identifier, book, message="No copies available."))
+            elif book.pk in held:
+                results.append(_result(identifier, book, message="Copies are held for the reservation queue."))
+            else:
+                already.add(book.pk)
+                eligible.append(book)
+                results.append(_result(identifier, book, ok=True, message="Borrowed."))
+
+        if eligible:
+            ids = [book.pk for book in eligible]
+            taken = Book.objects.filter(pk__in=ids, quantity__gt=0).update(
+                quantity=F('quantity') - 1,
+                is_borrowed=True,
+                borrowed_by=student,
+                borrowed_datetime=now,
+                to_be_returned=due,
+                updated_at=now,
+            )
+            if taken != len(ids):
+                raise _Raced()
+            Borrow.objects.bulk_create([
+                Borrow(student=student, book=book, borrowed_at=now, returned_due_date=due)
+                for book in eligible
+            ])
+            # their turn in these queues is used up
+            Reservation.objects.filter(student=student, book__in=ids).delete()
+            dashboard.invalidate(student.pk)
+            emptied = list(Book.objects.filter(pk__in=ids, quantity=0).values_list('pk', flat=True))
+            transaction.on_commit(lambda: books_updated.send(
+                sender=Book, book_ids=ids, now_unavailable=emptied
+            ))
+    return results
+
+
+def _checkout_one(student, identifier):
+    book = _resolve([identifier])[0]
+    if book is None:
+        return _result(identifier, message="No book with that id or ISBN.")
+    if reservations.ahead_of(book.pk, student).exists():
+        return _result(identifier, book, message="Copies are held for the reservation queue.")
+    try:
+        with transaction.atomic():
+            book.borrow(student)
+            Reservation.objects.filter(student=student, book=book).delete()
+    except ValidationError as e:
+        return _result(identifier, book, message=e.messages[0])
+    return _result(identifier, book, ok=True, message="Borrowed.")
+
+
+def bulk_return(student, identifiers):
+    """Check every listed book back in from ``student``."""
+    now = timezone.now()
+    with transaction.atomic():
+        books = _resolve(identifiers)
+        open_loans = Borrow.objects.filter(
+            student=student, returned_at__isnull=True,
+            book__in=[b for b in books if b],
+        )
+        if connection.features.has_select_for_update:
+            open_loans = open_loans.select_for_update()
+        open_loans = dict(open_loans.values_list('book_id', 'pk'))
+
+        loan_ids = []
+        for book in books:
+            if book is not None and book.pk in open_loans:
+                loan_ids.append(open_loans.pop(book.pk))
+        closed = set()
+        if loan_ids:
+            # Only loans still open are closed: a concurrent or repeated
+            # return of the same loan must not restock the copy twice.
+            # Our timestamp tells which rows this UPDATE closed.
+            Borrow.objects.filter(pk__in=loan_ids, returned_at__isnull=True).update(returned_at=now)
+            closed = set(Borrow.objects.filter(pk__in=loan_ids, returned_at=now).values_list('book_id', flat=True))
+
+        results, returned = [], set()
+        for identifier, book in zip(identifiers, books):
+            if book is None:
+                results.append(_result(identifier, message="No book with that id or ISBN."))
+            elif book.pk not in closed or book.pk in returned:
+                results.append(_result(identifier, book, message="Not borrowed by this student."))
+            else:
+                returned.add(book.pk)
+                results.append(_result(identifier, book, ok=True, message="Returned."))
+
+        if closed:
+            book_ids = list(closed)
+            dashboard.invalidate(student.pk)
+            Book.objects.filter(pk__in=book_ids).update(
+                quantity=F('quantity') + 1,
+                is_borrowed=False,
+                returned_datetime=now,
+                updated_at=now,
+            )
+            refilled = list(Book.objects.filter(pk__in=book_ids, quantity=1).values_list('pk', flat=True))
+            queued = set(Reservation.objects.filter(book__in=book_ids).values_list('book_id', flat=True))
+            transaction.on_commit(lambda: books_updated.send(
+                sender=Book, book_ids=book_ids, now_available=refilled
+            ))
+            for book_id in queued:
+                reservations.enqueue(book_id)
+    return results
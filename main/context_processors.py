@@ -0,0 +1,3 @@
+def role(request):
+    """Expose ``request.role`` to templates as ``role``."""
+    return {'role': getattr(request, 'role', None)}
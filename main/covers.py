@@ -0,0 +1,71 @@
+import hashlib, os
+from PIL import Image, ImageOps
+
+# Resized copies of Book.cover. Every file name carries a hash of the source
+# image, so a URL never changes meaning and the files can be served with a
+# far-future Cache-Control header. build_variants() only touches the file
+# system (no ORM), so the backfill command can run it in worker processes.
+
+SIZES = {
+    'thumb': 240,
+    'medium': 480,
+}
+VARIANT_DIR = 'covers/variants'
+
+
+def _content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _save(image, path, fmt, **options):
+    if os.path.exists(path):
+        return  # same hash, same bytes: already generated
+    tmp = f"{path}.tmp"
+    image.save(tmp, fmt, **options)
+    os.replace(tmp, path)
+
+
+def build_variants(media_root, name):
+    """
+    Generate the thumbnail/medium JPEG and WebP copies of one cover.
+
+    ``name`` is the cover's storage name relative to ``media_root``. Returns
+    the dict stored in Book.cover_variants.
+    """
+    source = os.path.join(media_root, name)
+    digest = _content_hash(source)
+    stem = os.path.splitext(os.path.basename(name))[0][:60]
+    os.makedirs(os.path.join(media_root, VARIANT_DIR), exist_ok=True)
+
+    variants = {'source': name, 'hash': digest}
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        for size, width in SIZES.items():
+            image = original.copy()
+            image.thumbnail((width, width * 2), Image.Resampling.LANCZOS)
+            flat = image
+            if image.mode not in ('RGB', 'L'):
+                # JPEG has no alpha channel; flatten onto white like the page
+                flat = Image.new('RGB', image.size, 'white')
+                flat.paste(image, mask=image.convert('RGBA').split()[-1])
+            jpeg = f"{VARIANT_DIR}/{stem}-{digest}-{size}.jpg"
+            webp = f"{VARIANT_DIR}/{stem}-{digest}-{size}.webp"
+            _save(flat, os.path.join(media_root, jpeg), 'JPEG', quality=85, optimize=True, progressive=True)
+            _save(image, os.path.join(media_root, webp), 'WEBP', quality=80, method=6)
+            variants[size] = {
+                'width': image.width,
+                'height': image.height,
+                'jpeg': jpeg,
+                'webp': webp,
+            }
+    return variants
+
+
+def needs_variants(book):
+    if not book.cover:
+        return bool(book.cover_variants)
+    return (book.cover_variants or {}).get('source') != book.cover.name
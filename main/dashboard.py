@@ -0,0 +1,86 @@
+import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import recommendations
+from .models import Borrow, CacheVersion, Reservation
+
+# The summary at the top of the student dashboard: books out, what is due
+# soon, fees, reservation queue positions and suggested books. It comes
+# from a few queries whose cost does not depend on how long the student's
+# history is, and is cached under a per-student CacheVersion. Borrowing,
+# returning and reservation changes bump the versions of the students they
+# affect (see signals.py and circulation.py), in whichever process they
+# happen. Fees grow with the date, so the UTC day is part of the key too,
+# as is the version of the recommendations.
+
+VERSION_KEY = 'student:{}:summary'
+SUMMARY_KEY = 'student:{}:summary:{}:{}:{}'
+
+
+def invalidate(*student_ids):
+    """Drop the cached summaries of ``student_ids`` once the transaction commits."""
+    if student_ids:
+        names = [VERSION_KEY.format(pk) for pk in student_ids]
+        transaction.on_commit(lambda: CacheVersion.bump(*names))
+
+
+def invalidate_queue(book_id):
+    """Everyone waiting for ``book_id`` may have moved up its queue."""
+    invalidate(*Reservation.objects.filter(book_id=book_id).values_list('student_id', flat=True))
+
+
+def compute(student_id, now=None):
+    now = now or timezone.now()
+    due_soon = now + datetime.timedelta(days=settings.DUE_SOON_DAYS)
+    loans = Borrow.objects.filter(student_id=student_id).with_late_fee(now)
+
+    active = list(
+        loans.filter(returned_at__isnull=True)
+             .order_by('returned_due_date', 'pk')
+             .values('pk', 'book_id', 'book__title', 'borrowed_at', 'returned_due_date', 'days_late', 'late_fee')
+    )
+    for loan in active:
+        loan['due_soon'] = loan['days_late'] <= 0 and loan['returned_due_date'] <= due_soon
+
+    # position in the queue = 1 + reservations of the same book placed earlier
+    ahead = (
+        Reservation.objects
+        .filter(book=OuterRef('book'))
+        .filter(Q(reserved_at__lt=OuterRef('reserved_at'))
+                | Q(reserved_at=OuterRef('reserved_at'), pk__lt=OuterRef('pk')))
+        .order_by().values('book').annotate(n=Count('pk')).values('n')
+    )
+    reservations = list(
+        Reservation.objects.filter(student_id=student_id)
+        .annotate(position=Coalesce(Subquery(ahead), Value(0)) + 1)
+        .order_by('reserved_at', 'pk')
+        .values('book_id', 'book__title', 'reserved_at', 'position')
+    )
+
+    totals = loans.aggregate(total_fees=Sum('late_fee'), borrowed=Count('pk'))
+    return {
+        'active': active,
+        'due_soon': sum(loan['due_soon'] for loan in active),
+        'overdue': sum(loan['days_late'] > 0 for loan in active),
+        'total_fees': totals['total_fees'] or 0,
+        'borrowed': totals['borrowed'],
+        'reservations': reservations,
+        'recommendations': recommendations.for_student(student_id),
+    }
+
+
+def summary(student_id):
+    """compute() for ``student_id``, from the cache while it is current."""
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    mine, picks = CacheVersion.current(VERSION_KEY.format(student_id), recommendations.VERSION_KEY).values()
+    key = SUMMARY_KEY.format(student_id, mine, picks, today.isoformat())
+    result = cache.get(key)
+    if result is None:
+        result = compute(student_id)
+        cache.set(key, result, settings.STUDENT_SUMMARY_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,76 @@
+from django.db import connection as default_connection
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Borrow
+
+# The librarian student directory: case-insensitive prefix search on names,
+# email and student ID, plus loan/fee flags computed in the same query.
+#
+# Django's istartswith is "UPPER(col::text) LIKE UPPER('abc%')" on
+# PostgreSQL and "col LIKE 'abc%'" (case-insensitive) on SQLite. A plain
+# btree index serves neither, so install() adds the expression indexes each
+# backend can use for those prefixes: text_pattern_ops on UPPER(col) for
+# PostgreSQL, NOCASE collation for SQLite. Student IDs are integers, so an
+# ID prefix becomes a handful of ranges on the existing unique index.
+
+PREFIX_FIELDS = ('last_name', 'first_name', 'email')
+MAX_ID_DIGITS = 10  # PositiveIntegerField tops out at 2147483647
+
+
+def _index_name(field):
+    return f"student_{field}_prefix_idx"
+
+
+def install(connection=default_connection):
+    """Create the prefix-search indexes. Safe to run repeatedly."""
+    with connection.cursor() as cursor:
+        for field in PREFIX_FIELDS:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {_index_name(field)} "
+                    f"ON main_student (UPPER({field}::text) text_pattern_ops)"
+                )
+            elif connection.vendor == 'sqlite':
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {_index_name(field)} ON main_student ({field} COLLATE NOCASE)"
+                )
+
+
+def uninstall(connection=default_connection):
+    with connection.cursor() as cursor:
+        for field in PREFIX_FIELDS:
+            cursor.execute(f"DROP INDEX IF EXISTS {_index_name(field)}")
+
+
+def _id_prefix(digits):
+    """student_id values whose decimal form starts with ``digits``."""
+    number, condition = int(digits), Q()
+    for extra in range(MAX_ID_DIGITS - len(digits) + 1):
+        scale = 10 ** extra
+        condition |= Q(student_id__gte=number * scale, student_id__lt=(number + 1) * scale)
+    return condition
+
+
+def search(queryset, query):
+    """Students matching every word of ``query`` as a prefix of some field."""
+    for term in query.split()[:5]:
+        if term.isdigit() and len(term) <= MAX_ID_DIGITS:
+            queryset = queryset.filter(_id_prefix(term))
+        else:
+            condition = Q()
+            for field in PREFIX_FIELDS:
+                condition |= Q(**{f'{field}__istartswith': term})
+            queryset = queryset.filter(condition)
+    return queryset
+
+
+def with_loan_flags(queryset, now=None):
+    """
+    Annotate ``has_loans`` (books still out) and ``has_fees`` (any loan with a
+    late fee, returned or not: the loans the dashboard's total_fees adds up).
+    """
+    loans = Borrow.objects.filter(student=OuterRef('pk'))
+    return queryset.annotate(
+        has_loans=Exists(loans.filter(returned_at__isnull=True)),
+        has_fees=Exists(loans.with_late_fee(now).filter(late_fee__gt=0)),
+    )
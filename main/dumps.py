@@ -0,0 +1,139 @@
+import csv, io, json, mmap, os, threading
+from array import array
+import numpy as np
+from django.conf import settings
+
+from .isbn import to_isbn13
+
+# Offline metadata provider backed by a local dump of bibliographic records,
+# one record per line: JSON Lines, or CSV with a header row. Next to the
+# dump we keep a sorted index as a .npy file of three contiguous uint64 rows
+# (ISBN-13, byte offset, length); both are memory-mapped, so a lookup is a binary search plus parsing
+# one line, and only the pages actually touched are ever read from disk.
+#
+# Records may use isbnlib's keys ("ISBN-13", "Title", "Authors", ...) or
+# their lower-case forms ("isbn", "title", "authors", ...). Authors may be a
+# list or a string separated by semicolons. When an ISBN appears more than
+# once, the last record wins, so corrections can simply be appended.
+
+ISBN_KEYS = ('ISBN-13', 'isbn13', 'isbn', 'ISBN')
+FIELDS = {
+    'Title': ('Title', 'title'),
+    'Authors': ('Authors', 'authors', 'author'),
+    'Publisher': ('Publisher', 'publisher'),
+    'Year': ('Year', 'year'),
+    'Language': ('Language', 'language'),
+}
+
+
+def _is_csv(path):
+    return path.lower().endswith('.csv')
+
+
+def _first(record, keys):
+    return next((record[k] for k in keys if record.get(k) not in (None, '')), None)
+
+
+def _meta(record):
+    """A dump record in isbnlib's metadata shape."""
+    meta = {name: _first(record, keys) or '' for name, keys in FIELDS.items()}
+    authors = meta['Authors']
+    if isinstance(authors, str):
+        authors = [a.strip() for a in authors.split(';') if a.strip()]
+    meta['Authors'] = authors
+    meta['Year'] = str(meta['Year'])[:4]
+    meta['ISBN-13'] = to_isbn13(_first(record, ISBN_KEYS))
+    return meta
+
+
+def index_path(path):
+    return f"{path}.idx.npy"
+
+
+def build_index(path):
+    """Scan the dump once and write its sorted index; returns the record count."""
+    path = os.fspath(path)
+    keys, offsets, lengths = array('Q'), array('Q'), array('Q')
+    with open(path, 'rb') as f:
+        header = None
+        if _is_csv(path):
+            header = next(csv.reader([f.readline().decode()]))
+        offset = f.tell()
+        for line in f:
+            text = line.strip()
+            if text:
+                if header:
+                    record = dict(zip(header, next(csv.reader([text.decode()]))))
+                else:
+                    record = json.loads(text)
+                isbn = to_isbn13(_first(record, ISBN_KEYS))
+                if isbn:
+                    keys.append(int(isbn))
+                    offsets.append(offset)
+                    lengths.append(len(line))
+            offset += len(line)
+
+    index = np.vstack([np.frombuffer(column, dtype=np.uint64) for column in (keys, offsets, lengths)])
+    # rows, not a structured array: searchsorted needs the keys contiguous
+    index = index[:, np.argsort(index[0], kind='stable')]
+    tmp = f"{index_path(path)}.tmp.npy"
+    np.save(tmp, index)
+    os.replace(tmp, index_path(path))
+    return index.shape[1]
+
+
+class DumpProvider:
+    """A metadata provider reading one dump file (see module comment)."""
+
+    # lookups are cheaper than a database round trip: skip the metadata cache
+    cacheable = False
+
+    def __init__(self, path):
+        self.path = path = os.fspath(path)
+        self.header = None
+        if not os.path.exists(index_path(path)) or os.path.getmtime(index_path(path)) < os.path.getmtime(path):
+            build_index(path)
+        self.keys, self.offsets, self.lengths = np.load(index_path(path), mmap_mode='r')
+        with open(path, 'rb') as f:
+            if _is_csv(path):
+                self.header = next(csv.reader([f.readline().decode()]))
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+
+    def __len__(self):
+        return len(self.keys)
+
+    def record(self, isbn):
+        isbn = to_isbn13(isbn)
+        if not isbn or not len(self.keys):
+            return None
+        key = np.uint64(isbn)
+        position = int(np.searchsorted(self.keys, key, side='right')) - 1
+        if position < 0 or self.keys[position] != key:
+            return None
+        offset, length = int(self.offsets[position]), int(self.lengths[position])
+        line = self.data[offset:offset + length].decode()
+        if self.header:
+            return dict(zip(self.header, next(csv.reader(io.StringIO(line)))))
+        return json.loads(line)
+
+    def __call__(self, isbn):
+        record = self.record(isbn)
+        return _meta(record) if record else {}
+
+
+_provider = None
+_lock = threading.Lock()
+
+
+def provider(isbn):
+    """METADATA_PROVIDER entry point for the dump named by METADATA_DUMP."""
+    global _provider
+    path = os.fspath(settings.METADATA_DUMP)
+    if _provider is None or _provider.path != path:
+        with _lock:
+            if _provider is None or _provider.path != path:
+                _provider = DumpProvider(path)
+    return _provider(isbn)
+
+
+provider.cacheable = False
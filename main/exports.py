@@ -0,0 +1,66 @@
+import csv
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Streaming loan exports. Rows come from QuerySet.iterator(), which on
+# PostgreSQL reads through a server-side cursor, and each row is encoded
+# and sent as soon as it is read, so an export of a whole term's loans
+# holds one chunk in memory at a time however many rows it has.
+
+LOAN_COLUMNS = {
+    'loan_id':      'pk',
+    'student_id':   'student__student_id',
+    'first_name':   'student__first_name',
+    'last_name':    'student__last_name',
+    'email':        'student__email',
+    'title':        'book__title',
+    'isbn':         'book__isbn',
+    'borrowed_at':  'borrowed_at',
+    'due':          'returned_due_date',
+    'returned_at':  'returned_at',
+    'days_late':    'days_late',
+    'late_fee':     'late_fee',
+}
+CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """csv.writer target that hands each encoded line back instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def loan_rows(queryset):
+    """Yield one dict per loan in ``queryset`` (annotated with_late_fee)."""
+    names = list(LOAN_COLUMNS)
+    for values in queryset.values_list(*LOAN_COLUMNS.values()).iterator(chunk_size=CHUNK_SIZE):
+        yield dict(zip(names, values))
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(LOAN_COLUMNS)
+    for row in rows:
+        yield writer.writerow(
+            value.isoformat() if hasattr(value, 'isoformat') else value for value in row.values()
+        )
+
+
+def _json_chunks(rows):
+    encoder = DjangoJSONEncoder()
+    yield '['
+    for n, row in enumerate(rows):
+        yield (',\n' if n else '\n') + encoder.encode(row)
+    yield '\n]\n'
+
+
+def stream(rows, fmt, filename):
+    """A StreamingHttpResponse with ``rows`` as a CSV or JSON attachment."""
+    if fmt == 'json':
+        response = StreamingHttpResponse(_json_chunks(rows), content_type='application/json')
+    else:
+        fmt = 'csv'
+        response = StreamingHttpResponse(_csv_lines(rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
@@ -0,0 +1,124 @@
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+# Facet counts are kept in FacetCount and adjusted by deltas on every write,
+# so the books page reads a few dozen small rows instead of running a
+# GROUP BY over the whole Book table per facet per request.
+
+FACET_FIELDS = ('language', 'year', 'publisher', 'quantity')
+PUBLISHER_LIMIT = 15
+
+
+def decade_of(year):
+    year = str(year or '')
+    return f"{year[:3]}0" if len(year) == 4 and year.isdigit() else ''
+
+
+def snapshot(book):
+    """The facet-relevant state of a book (model instance or values() dict)."""
+    get = book.get if isinstance(book, dict) else lambda name: getattr(book, name)
+    return (get('language'), decade_of(get('year')), get('publisher'), get('quantity') > 0)
+
+
+def deltas_for(state, sign):
+    """Counter of (facet, value) -> (total, available) changes for one book."""
+    language, decade, publisher, available = state
+    deltas = Counter()
+    for facet, value in (('language', language), ('decade', decade), ('publisher', publisher)):
+        if value:
+            deltas[(facet, value, 'total')] += sign
+            if available:
+                deltas[(facet, value, 'available')] += sign
+    return deltas
+
+
+def change_deltas(old_state, new_state):
+    """Deltas for a book that moved from ``old_state`` to ``new_state``."""
+    deltas = Counter()
+    if old_state is not None:
+        deltas.update(deltas_for(old_state, -1))
+    if new_state is not None:
+        deltas.update(deltas_for(new_state, +1))
+    return deltas
+
+
+def apply(deltas):
+    """Write a Counter of deltas with one conditional UPDATE per facet value."""
+    from .models import FacetCount
+
+    per_value = defaultdict(dict)
+    for (facet, value, column), amount in deltas.items():
+        if amount:
+            per_value[(facet, value[:100])][column] = amount
+
+    with transaction.atomic():
+        for (facet, value), changes in per_value.items():
+            updates = {column: F(column) + amount for column, amount in changes.items()}
+            if not FacetCount.objects.filter(facet=facet, value=value).update(**updates):
+                FacetCount.objects.get_or_create(facet=facet, value=value)
+                FacetCount.objects.filter(facet=facet, value=value).update(**updates)
+        # values that no book carries any more are just noise in the sidebar
+        FacetCount.objects.filter(total__lte=0).delete()
+
+
+def availability_deltas(rows, sign):
+    """Deltas for books (values() rows) that gained (+1) or lost (-1) their last copy."""
+    deltas = Counter()
+    for row in rows:
+        state = snapshot({**row, 'quantity': 1})
+        deltas.update({key: n for key, n in deltas_for(state, sign).items() if key[2] == 'available'})
+    return deltas
+
+
+def rebuild(Book=None, FacetCount=None):
+    """
+    Recompute every facet from scratch (one GROUP BY per facet).
+
+    Migrations pass their historical models; everyone else gets the real ones.
+    """
+    if Book is None or FacetCount is None:
+        from .models import Book, FacetCount
+
+    rows = []
+    available = Count('id', filter=Q(quantity__gt=0))
+    for facet, field in (('language', 'language'), ('publisher', 'publisher')):
+        for row in Book.objects.values(field).annotate(total=Count('id'), available=available).order_by():
+            if row[field]:
+                rows.append(FacetCount(facet=facet, value=row[field][:100],
+                                       total=row['total'], available=row['available']))
+
+    decades = Counter()
+    for row in Book.objects.values('year').annotate(total=Count('id'), available=available).order_by():
+        decade = decade_of(row['year'])
+        if decade:
+            decades[(decade, 'total')] += row['total']
+            decades[(decade, 'available')] += row['available']
+    for decade in {d for d, _ in decades}:
+        rows.append(FacetCount(facet='decade', value=decade,
+                               total=decades[(decade, 'total')], available=decades[(decade, 'available')]))
+
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def summary(available_only=False):
+    """Facet values and counts for the catalog sidebar."""
+    from .models import Book, FacetCount
+
+    count = 'available' if available_only else 'total'
+    languages = dict(Book.LANGUAGE_CHOICES)
+    facets = {'language': [], 'decade': [], 'publisher': []}
+    for row in FacetCount.objects.filter(**{f'{count}__gt': 0}).order_by('facet', f'-{count}', 'value'):
+        facets[row.facet].append({
+            'value': row.value,
+            'label': languages.get(row.value, row.value) if row.facet == 'language' else row.value,
+            'count': getattr(row, count),
+        })
+    for decade in facets['decade']:
+        decade['last_year'] = str(int(decade['value']) + 9)
+    facets['decade'].sort(key=lambda f: f['value'], reverse=True)
+    facets['publisher'] = facets['publisher'][:PUBLISHER_LIMIT]
+    return facets
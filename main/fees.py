@@ -0,0 +1,49 @@
+import numpy as np
+from django.utils import timezone
+
+from .models import LATE_FEE_PER_DAY
+
+# Late fees for whole batches of loans at once. Inside the database use
+# Borrow.objects.with_late_fee(); this is the offline path for exports and
+# batch jobs that already hold the loan dates in memory. Both follow
+# Borrow.calculate_late_fee: UTC calendar days past the due date, up to the
+# return (or now), at LATE_FEE_PER_DAY each.
+
+
+SECONDS_PER_DAY = 86400
+
+
+def _utc_days(values):
+    """Aware datetimes (None allowed) -> float days since the epoch, UTC."""
+    seconds = np.fromiter(
+        (v.timestamp() if v is not None else np.nan for v in values),
+        dtype=np.float64, count=len(values),
+    )
+    return np.floor(seconds / SECONDS_PER_DAY)
+
+
+def days_late(due_dates, returned_dates, now=None):
+    due = _utc_days(due_dates)
+    end = _utc_days(returned_dates)
+    today = _utc_days([now or timezone.now()])[0]
+    end = np.where(np.isnan(end), today, end)
+    return (end - due).astype(np.int64)
+
+
+def late_fees(due_dates, returned_dates, now=None):
+    """Vectorised calculate_late_fee over parallel sequences of loan dates."""
+    return np.maximum(days_late(due_dates, returned_dates, now), 0) * LATE_FEE_PER_DAY
+
+
+def queryset_late_fees(queryset, now=None, chunk_size=50000):
+    """
+    Yield ``(borrow_ids, fees)`` array pairs for a Borrow queryset, streaming
+    it ``chunk_size`` rows at a time so memory stays bounded.
+    """
+    rows = queryset.values_list('pk', 'returned_due_date', 'returned_at').iterator(chunk_size=chunk_size)
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            return
+        ids, due, returned = zip(*chunk)
+        yield np.array(ids), late_fees(due, returned, now)
@@ -1,6 +1,7 @@
 from django import forms
 from django.core.exceptions import ValidationError
 
+from .isbn import to_isbn13
 from .models import Book, Borrow, Reservation, Student, Librarian
 
 class BookForm(forms.ModelForm):
@@ -105,9 +106,38 @@ class RemoveBookForm(forms.Form):
     )
 
     def clean_isbn(self):
-        raw_isbn = self.cleaned_data['isbn']
-        cleaned_isbn = raw_isbn.replace('-', '')
-        return cleaned_isbn
+        isbn = to_isbn13(self.cleaned_data['isbn'])
+        if not isbn:
+            raise ValidationError("Enter a valid ISBN-10 or ISBN-13.")
+        return isbn
+
+class BulkCirculationForm(forms.Form):
+    ACTION_CHOICES = [
+        ('checkout', 'Check out'),
+        ('return', 'Return'),
+    ]
+
+    student_id = forms.IntegerField(label="Student ID")
+    action = forms.ChoiceField(choices=ACTION_CHOICES)
+    items = forms.CharField(
+        widget=forms.Textarea(attrs={'rows': 10}),
+        help_text="One ISBN or book id per line (scan them in)"
+    )
+
+    def clean_student_id(self):
+        try:
+            self.student = Student.objects.get(student_id=self.cleaned_data['student_id'])
+        except Student.DoesNotExist:
+            raise ValidationError("No student with that ID.")
+        return self.cleaned_data['student_id']
+
+    def clean_items(self):
+        items = [line.strip() for line in self.cleaned_data['items'].splitlines() if line.strip()]
+        if not items:
+            raise ValidationError("Scan at least one book.")
+        if len(items) > 200:
+            raise ValidationError("At most 200 books per transaction.")
+        return items
 
 class RegistrationForm(forms.Form):
     email = forms.EmailField(label="KSU Email")
@@ -0,0 +1,13 @@
+import isbnlib
+
+# ISBN handling shared by the catalog, the importer and the metadata cache.
+
+
+def to_isbn13(value):
+    """The canonical ISBN-13 (digits only) for an ISBN-10 or -13, else None."""
+    digits = isbnlib.canonical(str(value or ''))
+    if isbnlib.is_isbn13(digits):
+        return digits
+    if isbnlib.is_isbn10(digits):
+        return isbnlib.to_isbn13(digits)
+    return None
@@ -0,0 +1,71 @@
+import os, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main import covers
+from main.models import Book, books_updated
+
+class Command(BaseCommand):
+    help = "Generate thumbnail/medium JPEG and WebP copies for existing book covers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", "-w",
+            type=int, default=os.cpu_count(),
+            help="Worker processes used for resizing (default: CPU count)"
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild variants even for covers that already have them"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int, default=200,
+            help="Books written back per UPDATE batch"
+        )
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(cover='').exclude(cover__isnull=True).only('id', 'cover', 'cover_variants')
+        todo = {b.pk: b for b in books.iterator() if options["force"] or covers.needs_variants(b)}
+        if not todo:
+            return self.stdout.write("All covers already have variants.")
+
+        started = time.monotonic()
+        done, failed, pending = 0, 0, []
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = {
+                pool.submit(covers.build_variants, str(settings.MEDIA_ROOT), book.cover.name): pk
+                for pk, book in todo.items()
+            }
+            for future in as_completed(futures):
+                book = todo[futures[future]]
+                try:
+                    book.cover_variants = future.result()
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f"Error {book.cover.name}: {e}")
+                    continue
+                pending.append(book)
+                if len(pending) >= options["batch_size"]:
+                    done += self._flush(pending)
+
+        done += self._flush(pending)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Built variants for {done} covers ({failed} failed) in {elapsed:.1f}s "
+            f"({done / elapsed if elapsed else 0:.1f} covers/s)"
+        ))
+
+    def _flush(self, pending):
+        # bulk_update skips the post_save signal: touch updated_at (book page
+        # ETag) and send books_updated (cards, catalog ETag) ourselves
+        now = timezone.now()
+        for book in pending:
+            book.updated_at = now
+        Book.objects.bulk_update(pending, ['cover_variants', 'updated_at'])
+        books_updated.send(sender=Book, book_ids=[book.pk for book in pending])
+        count = len(pending)
+        pending.clear()
+        return count
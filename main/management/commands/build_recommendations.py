@@ -0,0 +1,46 @@
+import time
+from django.core.management.base import BaseCommand
+from main import recommendations
+
+class Command(BaseCommand):
+    help = "Rebuild the \"also borrowed\" recommendations from the whole borrow history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-k", "-k",
+            type=int, default=recommendations.TOP_K,
+            help="Neighbours kept per book"
+        )
+        parser.add_argument(
+            "--min-support",
+            type=int, default=recommendations.MIN_SUPPORT,
+            help="Students who must have borrowed both books"
+        )
+        parser.add_argument(
+            "--max-history",
+            type=int, default=recommendations.MAX_HISTORY,
+            help="Most recent distinct books per student taken into account"
+        )
+
+    def handle(self, *args, **options):
+        began = time.perf_counter()
+        students, books = recommendations.load_pairs()
+        loaded = time.perf_counter()
+        self.stdout.write(
+            f"Loaded {len(books)} student/book pairs ({len(set(students.tolist()))} students) "
+            f"in {loaded - began:.1f}s"
+        )
+
+        result = recommendations.build(
+            students, books,
+            top_k=options["top_k"], min_support=options["min_support"], max_history=options["max_history"],
+        )
+        built = time.perf_counter()
+        self.stdout.write(f"Computed neighbours for {len(set(result[0].tolist()))} books in {built - loaded:.1f}s")
+
+        stored = recommendations.store(*result)
+        elapsed = time.perf_counter() - began
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {stored} recommendations in {time.perf_counter() - built:.1f}s "
+            f"({elapsed:.1f}s in all)."
+        ))
@@ -0,0 +1,197 @@
+import csv, os, time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from main.models import Librarian, Student
+
+# Account type follows the address, as in the register view
+ROLES = {
+    'students.kennesaw.edu': 'Student',
+    'staff.kennesaw.edu': 'Librarian',
+}
+SEXES = {value for value, _ in Student.GENDER_CHOICES}
+YEARS = {value for value, _ in Student.YEAR_CHOICES}
+# student_id/staff_id are PositiveIntegerFields; PostgreSQL rejects anything
+# larger with a DataError that would abort the whole batch
+MAX_ID = 2147483647
+
+
+class Command(BaseCommand):
+    help = (
+        "Create student and librarian accounts from a CSV roster with columns "
+        "email, first_name, middle_initial, last_name, sex, id, year and optional password"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file", "-f",
+            required=True,
+            help="Path to the roster CSV (header row required)"
+        )
+        parser.add_argument(
+            "--workers", "-w",
+            type=int, default=os.cpu_count(),
+            help="Processes hashing passwords (default: CPU count)"
+        )
+        parser.add_argument(
+            "--batch-size", "-b",
+            type=int, default=1000,
+            help="Accounts written per transaction"
+        )
+        parser.add_argument(
+            "--unusable-passwords",
+            action="store_true",
+            help="Ignore the password column; accounts need a password set before they can log in"
+        )
+        parser.add_argument(
+            "--errors",
+            help="Write rejected rows, with the reason, to this CSV"
+        )
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        if not os.path.exists(path):
+            return self.stderr.write(self.style.ERROR(f"File not found: {path}"))
+
+        began = time.perf_counter()
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames or []
+            lines = list(reader)
+
+        rows, rejected = self.validate(lines, options["unusable_passwords"])
+        for line_number, row, reason in rejected:
+            self.stderr.write(f"Row {line_number}: {reason}")
+        groups = {name: Group.objects.get_or_create(name=name)[0] for name in ROLES.values()}
+
+        # PBKDF2 is deliberately slow and CPU-bound, so real passwords go to a
+        # process pool. map() submits them all up front and yields hashes in
+        # order, so the pool keeps hashing while this thread writes batches.
+        passwords = [row["password"] for row in rows if row["password"]]
+        pool = ProcessPoolExecutor(max_workers=options["workers"]) if passwords else None
+        hashes = iter(())
+        if pool:
+            chunksize = max(1, min(64, len(passwords) // (4 * options["workers"])))
+            hashes = pool.map(make_password, passwords, chunksize=chunksize)
+
+        created, remaining = 0, iter(rows)
+        try:
+            for number, batch in enumerate(iter(lambda: list(islice(remaining, options["batch_size"])), []), 1):
+                batch_began = time.perf_counter()
+                for row in batch:
+                    row["hash"] = next(hashes) if row["password"] else make_password(None)
+                hashed = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        self.write(batch, groups)
+                except IntegrityError as e:
+                    # someone registered one of these meanwhile; a rerun skips them
+                    rejected.extend((row["line"], row["source"], f"Batch {number} not written: {e}") for row in batch)
+                    self.stderr.write(self.style.ERROR(f"Batch {number} not written: {e}"))
+                    continue
+                created += len(batch)
+                self.stdout.write(
+                    f"Batch {number}: {len(batch)} accounts, waited {hashed - batch_began:.2f}s for hashes, "
+                    f"wrote in {time.perf_counter() - hashed:.2f}s"
+                )
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+        if options["errors"] and rejected:
+            with open(options["errors"], "w", newline="") as f:
+                writer = csv.DictWriter(f, [*fieldnames, "error"], extrasaction="ignore")
+                writer.writeheader()
+                for _, row, reason in sorted(rejected, key=lambda r: r[0]):
+                    writer.writerow({**row, "error": reason})
+
+        elapsed = time.perf_counter() - began
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(lines)} rows in {elapsed:.1f}s ({len(lines) / max(elapsed, 1e-9):.0f} rows/s): "
+            f"{created} accounts created, {len(rejected)} rejected."
+        ))
+
+    def validate(self, lines, unusable_passwords):
+        """Split the roster into rows to create and ``(line, row, reason)`` rejects."""
+        # one query per table for everything already registered
+        usernames = set(User.objects.values_list("username", flat=True))
+        taken = {
+            "Student": (set(Student.objects.values_list("student_id", flat=True)),
+                        set(Student.objects.values_list("email", flat=True))),
+            "Librarian": (set(Librarian.objects.values_list("staff_id", flat=True)),
+                          set(Librarian.objects.values_list("email", flat=True))),
+        }
+
+        rows, rejected = [], []
+        for line_number, source in enumerate(lines, 2):
+            value = lambda name: (source.get(name) or "").strip()
+            email = value("email").lower()
+            role = ROLES.get(email.rpartition("@")[2])
+            row = {
+                "line": line_number, "source": source, "role": role, "email": email,
+                "first_name": value("first_name"), "middle_initial": value("middle_initial"),
+                "last_name": value("last_name"), "sex": value("sex").upper(), "year": value("year").upper(),
+                "password": "" if unusable_passwords else value("password"),
+            }
+            ids, emails = taken.get(role, (set(), set()))
+            ident = value("id")
+
+            if not role:
+                reason = "Use a @students.kennesaw.edu or @staff.kennesaw.edu address."
+            elif not (row["first_name"] and row["last_name"]):
+                reason = "First and last name are required."
+            elif len(row["first_name"]) > 30 or len(row["last_name"]) > 30 or len(row["middle_initial"]) > 1:
+                reason = "Name too long."
+            elif row["sex"] not in SEXES:
+                reason = f"Invalid sex: {value('sex')!r}."
+            elif role == "Student" and row["year"] and row["year"] not in YEARS:
+                reason = f"Invalid year: {value('year')!r}."
+            elif not (ident.isascii() and ident.isdigit()):
+                reason = f"Invalid id: {ident!r}."
+            elif int(ident) > MAX_ID:
+                reason = f"Id {ident} is out of range (at most {MAX_ID})."
+            elif email in usernames or email in emails:
+                reason = f"{email} is already registered."
+            elif int(ident) in ids:
+                reason = f"{role} id {ident} is already registered."
+            else:
+                row["id"] = int(ident)
+                # later rows with the same address or id are duplicates of this one
+                usernames.add(email)
+                emails.add(email)
+                ids.add(row["id"])
+                rows.append(row)
+                continue
+            rejected.append((line_number, source, reason))
+        return rows, rejected
+
+    def write(self, batch, groups):
+        # bulk_create skips save() and signals; new accounts have no sessions
+        # or cached roles to invalidate
+        User.objects.bulk_create([
+            User(username=row["email"], email=row["email"], password=row["hash"],
+                 first_name=row["first_name"], last_name=row["last_name"])
+            for row in batch
+        ])
+        # not every backend returns primary keys from a bulk insert
+        user_ids = dict(User.objects.filter(username__in=[row["email"] for row in batch]).values_list("username", "pk"))
+
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=user_ids[row["email"]], group_id=groups[row["role"]].pk)
+            for row in batch
+        ])
+        Student.objects.bulk_create([
+            Student(user_id=user_ids[row["email"]], first_name=row["first_name"],
+                    middle_initial=row["middle_initial"], last_name=row["last_name"],
+                    sex=row["sex"], year=row["year"], student_id=row["id"], email=row["email"])
+            for row in batch if row["role"] == "Student"
+        ])
+        Librarian.objects.bulk_create([
+            Librarian(user_id=user_ids[row["email"]], first_name=row["first_name"],
+                      middle_initial=row["middle_initial"], last_name=row["last_name"],
+                      sex=row["sex"], staff_id=row["id"], email=row["email"])
+            for row in batch if row["role"] == "Librarian"
+        ])
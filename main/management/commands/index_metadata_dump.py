@@ -0,0 +1,23 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from main import dumps
+
+class Command(BaseCommand):
+    help = "Build the lookup index for a local metadata dump (JSONL or CSV)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file", "-f",
+            help="Path to the dump (default: METADATA_DUMP)"
+        )
+
+    def handle(self, *args, **options):
+        path = options["file"] or settings.METADATA_DUMP
+        began = time.perf_counter()
+        count = dumps.build_index(path)
+        elapsed = time.perf_counter() - began
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} records in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} records/s) "
+            f"-> {dumps.index_path(path)}"
+        ))
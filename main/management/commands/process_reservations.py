@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from main import reservations
+
+class Command(BaseCommand):
+    help = "Lend returned copies to students waiting in reservation queues"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep sweeping instead of exiting after one pass"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float, default=30,
+            help="Seconds between sweeps with --loop"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            promoted = reservations.promote_all()
+            if promoted or not options["loop"]:
+                self.stdout.write(f"Promoted {promoted} reservations.")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
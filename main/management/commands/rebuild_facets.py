@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from main import facets
+
+class Command(BaseCommand):
+    help = "Recompute the catalog facet counts from the Book table"
+
+    def handle(self, *args, **options):
+        rows = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} facet values."))
@@ -0,0 +1,60 @@
+import datetime, time
+from django.core.management.base import BaseCommand, CommandError
+from main import analytics
+
+class Command(BaseCommand):
+    help = "Update the daily circulation rollups behind the librarian dashboard (resumable)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-days",
+            type=int, default=31,
+            help="Days rolled up per transaction"
+        )
+        parser.add_argument(
+            "--since",
+            help="Recompute from this day (YYYY-MM-DD), e.g. after correcting old loans"
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Recompute everything from the first loan"
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep updating instead of exiting after one pass"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float, default=300,
+            help="Seconds between updates with --loop"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since = datetime.date.fromisoformat(options["since"]) if options["since"] else None
+        except ValueError:
+            raise CommandError(f"Invalid date: {options['since']}")
+
+        while True:
+            began = time.perf_counter()
+
+            def progress(checkpoint, start, end):
+                elapsed = time.perf_counter() - began
+                self.stdout.write(
+                    f"  {start} to {end - datetime.timedelta(days=1)}: "
+                    f"{checkpoint.processed} loans read ({checkpoint.processed / max(elapsed, 1e-9):.0f} rows/s)"
+                )
+
+            checkpoint = analytics.rollup(
+                chunk_days=options["chunk_days"], since=since, restart=options["restart"], progress=progress,
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Rolled up circulation through {checkpoint.run_date} "
+                f"in {time.perf_counter() - began:.1f}s."
+            ))
+            if not options["loop"]:
+                return
+            since, options["restart"] = None, False
+            time.sleep(options["interval"])
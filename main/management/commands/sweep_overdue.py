@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand
+from main import notices
+
+class Command(BaseCommand):
+    help = "Record and mail late-fee notices for every overdue loan (run nightly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int, default=2000,
+            help="Loans read and written per batch"
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore today's checkpoint and sweep every loan again"
+        )
+        parser.add_argument(
+            "--no-send",
+            action="store_true",
+            help="Only fill the outbox; leave the notices unsent"
+        )
+
+    def handle(self, *args, **options):
+        began = time.perf_counter()
+
+        def progress(checkpoint):
+            elapsed = time.perf_counter() - began
+            self.stdout.write(
+                f"  {checkpoint.processed} loans up to id {checkpoint.last_id} "
+                f"({checkpoint.processed / elapsed:.0f} rows/s)"
+            )
+
+        checkpoint = notices.sweep(chunk_size=options["chunk_size"], restart=options["restart"], progress=progress)
+        elapsed = time.perf_counter() - began
+        self.stdout.write(self.style.SUCCESS(
+            f"Swept {checkpoint.processed} overdue loans for {checkpoint.run_date} "
+            f"in {elapsed:.1f}s ({checkpoint.processed / max(elapsed, 1e-9):.0f} rows/s)."
+        ))
+
+        if not options["no_send"]:
+            sent = notices.deliver()
+            self.stdout.write(self.style.SUCCESS(f"Sent {sent} notices."))
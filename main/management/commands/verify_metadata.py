@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from main import verification
+
+class Command(BaseCommand):
+    help = "Check books still pending metadata verification against their ISBN metadata"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            help="Check at most this many books per sweep"
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep sweeping instead of exiting after one pass"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float, default=60,
+            help="Seconds between sweeps with --loop"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            settled = verification.verify_pending(options["limit"])
+            if settled or not options["loop"]:
+                self.stdout.write(f"Verified {settled} books.")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
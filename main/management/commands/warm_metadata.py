@@ -0,0 +1,59 @@
+import os, time
+from django.core.management.base import BaseCommand
+from main import metadata
+
+class Command(BaseCommand):
+    help = "Fill the ISBN metadata cache from a newline-delimited ISBN file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file", "-f",
+            default="valid_isbns.txt",
+            help="Path to ISBN list (one per line)"
+        )
+        parser.add_argument(
+            "--workers", "--concurrency", "-w",
+            type=int, default=8,
+            help="Metadata lookups to run at once"
+        )
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="Fetch again even when the cached answer is still fresh"
+        )
+        parser.add_argument(
+            "--provider",
+            help="Dotted path to a metadata provider (default: METADATA_PROVIDER)"
+        )
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        if not os.path.exists(path):
+            return self.stderr.write(self.style.ERROR(f"File not found: {path}"))
+
+        with open(path) as f:
+            isbns = list(dict.fromkeys(l.strip() for l in f if l.strip()))
+
+        began = time.perf_counter()
+        found = empty = failed = 0
+        results = metadata.fetch_many(
+            isbns,
+            provider=options["provider"],
+            workers=options["workers"],
+            refresh=options["refresh"],
+        )
+        for isbn, meta, error in results:
+            if error:
+                failed += 1
+                self.stderr.write(f"Error {isbn}: {error}")
+            elif meta:
+                found += 1
+            else:
+                empty += 1
+
+        elapsed = time.perf_counter() - began
+        stats = metadata.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(isbns)} ISBNs in {elapsed:.1f}s: {found} with metadata, {empty} without, {failed} failed. "
+            f"Cache: {stats['entries']} entries, {stats['hits']} hits / {stats['misses']} misses."
+        ))
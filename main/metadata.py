@@ -0,0 +1,210 @@
+import datetime, random, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .isbn import to_isbn13
+
+# Book metadata lookups by ISBN. A provider is any callable taking an ISBN
+# and returning isbnlib's metadata dict ({} or None when nothing is known);
+# METADATA_PROVIDER names the one to use, so tests and offline imports can
+# swap in a local source. fetch_many() runs a provider over many ISBNs on a
+# bounded thread pool, retrying failed calls with exponential backoff.
+# main.dumps.provider answers from a local catalog dump instead of the network.
+#
+# Results are cached by ISBN-13 in the IsbnMetadata table, with a small LRU
+# in front of it in each process. Lookups that found nothing are cached too,
+# for a shorter time. Exceptions are never cached. Cache reads and writes
+# happen on the caller's thread; the pool threads only talk to the provider.
+
+HITS_KEY   = 'isbn-metadata:hits'
+MISSES_KEY = 'isbn-metadata:misses'
+STORE_BATCH_SIZE = 500
+
+
+class _LRU:
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_memory = _LRU(settings.METADATA_CACHE_LRU_SIZE)
+
+
+def isbnlib_provider(isbn):
+    import isbnlib
+    return isbnlib.meta(isbn, service=settings.METADATA_SERVICE)
+
+
+def get_provider(provider=None):
+    provider = provider or settings.METADATA_PROVIDER
+    return import_string(provider) if isinstance(provider, str) else provider
+
+
+def fetch(provider, isbn, retries=3, backoff=0.5):
+    """One lookup; failures are retried after backoff, 2*backoff, ... (with jitter)."""
+    for attempt in range(retries + 1):
+        try:
+            return provider(isbn) or {}
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def _fetch_all(isbns, provider, workers, retries, backoff):
+    def task(isbn):
+        try:
+            return isbn, fetch(provider, isbn, retries, backoff), None
+        except Exception as e:
+            return isbn, None, e
+
+    if workers <= 1:
+        yield from map(task, isbns)
+        return
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='metadata') as pool:
+        yield from pool.map(task, isbns)
+
+
+def fetch_many(isbns, provider=None, workers=8, retries=3, backoff=0.5, use_cache=True, refresh=False):
+    """
+    Yield ``(isbn, meta, error)`` for each ISBN, in input order, with at most
+    ``workers`` lookups in flight. ``error`` is the exception from the last
+    attempt when every retry failed, else None. With ``use_cache``, fresh
+    cache entries are served without calling the provider and new results
+    are written back; ``refresh`` skips the cache read but still writes.
+    """
+    isbns = list(isbns)
+    provider = get_provider(provider)
+    use_cache = use_cache and getattr(provider, 'cacheable', True)
+    known = cached(isbns) if use_cache and not refresh else {}
+    fetched = _fetch_all([i for i in isbns if i not in known], provider, workers, retries, backoff)
+
+    pending, hits, misses = [], 0, 0
+    try:
+        for isbn in isbns:
+            if isbn in known:
+                hits += 1
+                yield isbn, known[isbn], None
+                continue
+            result = next(fetched)
+            misses += 1
+            if use_cache and result[2] is None:
+                pending.append(result[:2])
+                if len(pending) >= STORE_BATCH_SIZE:
+                    store(pending)
+                    pending = []
+            yield result
+    finally:
+        if pending:
+            store(pending)
+        if use_cache:
+            _count(HITS_KEY, hits)
+            _count(MISSES_KEY, misses)
+        fetched.close()
+
+def _count(key, amount):
+    if amount:
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.add(key, 0, None)
+            cache.incr(key, amount)
+
+
+def _expires(meta, fetched_at):
+    ttl = settings.METADATA_CACHE_TTL if meta else settings.METADATA_CACHE_NEGATIVE_TTL
+    return fetched_at + datetime.timedelta(seconds=ttl)
+
+
+def cached(isbns):
+    """``{isbn: meta}`` for every ISBN with a fresh cache entry ({} = known to have none)."""
+    from .models import IsbnMetadata
+
+    now = timezone.now()
+    keys = {isbn: to_isbn13(isbn) for isbn in isbns}
+    found, missing = {}, set()
+    for key in filter(None, set(keys.values())):
+        entry = _memory.get(key)
+        if entry and entry[1] > now:
+            found[key] = entry[0]
+        else:
+            missing.add(key)
+    missing = list(missing)
+    for start in range(0, len(missing), STORE_BATCH_SIZE):
+        rows = IsbnMetadata.objects.filter(isbn13__in=missing[start:start + STORE_BATCH_SIZE])
+        for row in rows.values_list('isbn13', 'data', 'fetched_at'):
+            key, meta, fetched_at = row
+            expires = _expires(meta, fetched_at)
+            if expires > now:
+                found[key] = meta or {}
+                _memory.put(key, (found[key], expires))
+    return {isbn: found[key] for isbn, key in keys.items() if key in found}
+
+
+def store(results):
+    """Cache ``(isbn, meta)`` pairs; pairs whose ISBN is not valid are ignored."""
+    from .models import IsbnMetadata
+
+    now = timezone.now()
+    rows = {}
+    for isbn, meta in results:
+        key = to_isbn13(isbn)
+        if key:
+            rows[key] = IsbnMetadata(isbn13=key, data=meta or None, fetched_at=now)
+            _memory.put(key, (meta or {}, _expires(meta, now)))
+    IsbnMetadata.objects.bulk_create(
+        rows.values(), batch_size=STORE_BATCH_SIZE,
+        update_conflicts=True, unique_fields=['isbn13'], update_fields=['data', 'fetched_at'],
+    )
+
+
+def lookup(isbn, provider=None, retries=3, backoff=0.5):
+    """Metadata for one ISBN, from the cache when it is fresh."""
+    [(_, meta, error)] = fetch_many([isbn], provider, workers=1, retries=retries, backoff=backoff)
+    if error:
+        raise error
+    return meta
+
+
+def clear_memory():
+    """Empty this process's LRU (the table is left alone)."""
+    _memory.clear()
+
+
+def stats():
+    from .models import IsbnMetadata
+
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+        'entries': IsbnMetadata.objects.count(),
+        'negative_entries': IsbnMetadata.objects.filter(data__isnull=True).count(),
+        'memory_entries': len(_memory.entries),
+    }
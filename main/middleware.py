@@ -0,0 +1,13 @@
+from django.utils.functional import SimpleLazyObject
+from . import roles
+
+
+class RoleMiddleware:
+    """Attach ``request.role``; resolved on first use, then from the session."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.role = SimpleLazyObject(lambda: roles.get_role(request))
+        return self.get_response(request)
@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-17 06:31
+
+from django.db import migrations, models
+
+
+def build_facet_counts(apps, schema_editor):
+    from main import facets
+    facets.rebuild(apps.get_model('main', 'Book'), apps.get_model('main', 'FacetCount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_book_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('language', 'Language'), ('decade', 'Decade'), ('publisher', 'Publisher')], max_length=10)),
+                ('value', models.CharField(max_length=100)),
+                ('total', models.IntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['language', 'id'], name='book_language_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['publisher', 'id'], name='book_publisher_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['year', 'id'], name='book_year_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='facetcount',
+            unique_together={('facet', 'value')},
+        ),
+        migrations.RunPython(build_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-17 06:36
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def close_duplicate_open_loans(apps, schema_editor):
+    # The old borrow code allowed the same student to hold several open
+    # loans of one book (double submits). Keep the newest, close the others
+    # as of their own borrow time (so they carry no late fee) and give each
+    # closed loan's copy back to the shelf.
+    Book = apps.get_model('main', 'Book')
+    Borrow = apps.get_model('main', 'Borrow')
+    duplicated = (
+        Borrow.objects.filter(returned_at__isnull=True)
+        .values('student_id', 'book_id').annotate(n=Count('pk')).filter(n__gt=1)
+    )
+    for pair in duplicated:
+        loans = Borrow.objects.filter(
+            returned_at__isnull=True, student_id=pair['student_id'], book_id=pair['book_id'],
+        ).order_by('-borrowed_at', '-pk')
+        extra = list(loans.values_list('pk', flat=True)[1:])
+        Borrow.objects.filter(pk__in=extra).update(returned_at=F('borrowed_at'))
+        Book.objects.filter(pk=pair['book_id']).update(quantity=F('quantity') + len(extra))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_book_cover_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_open_loans, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='borrow',
+            constraint=models.UniqueConstraint(condition=models.Q(('returned_at__isnull', True)), fields=('student', 'book'), name='one_open_loan_per_student_book'),
+        ),
+    ]
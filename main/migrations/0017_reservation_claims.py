@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-17 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_borrow_one_open_loan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['book', 'reserved_at'], name='reservation_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_reservation_claims'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(condition=models.Q(('returned_at__isnull', True)), fields=['returned_due_date'], name='borrow_open_due_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-17 06:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_borrow_open_due_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('run_date', models.DateField()),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OverdueNotice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_date', models.DateField()),
+                ('days_late', models.PositiveIntegerField()),
+                ('late_fee', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('borrow', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='overdue_notices', to='main.borrow')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sent_at', 'id'], name='notice_outbox_idx')],
+                'unique_together': {('borrow', 'run_date')},
+            },
+        ),
+    ]
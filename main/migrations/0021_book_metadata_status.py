@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_isbn_metadata_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='metadata_checked_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='metadata_problems',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        # existing books passed the old synchronous check when they were added
+        migrations.AddField(
+            model_name='book',
+            name='metadata_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('verified', 'Verified'), ('mismatch', 'Mismatch')], default='verified', editable=False, max_length=8),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='metadata_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('verified', 'Verified'), ('mismatch', 'Mismatch')], default='pending', editable=False, max_length=8),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['metadata_status', 'id'], name='book_metadata_status_idx'),
+        ),
+    ]
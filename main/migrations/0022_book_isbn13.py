@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-17 07:04
+
+from django.db import migrations, models
+
+
+def backfill_isbn13(apps, schema_editor):
+    from main.isbn import to_isbn13
+
+    Book = apps.get_model('main', 'Book')
+    seen, batch = set(), []
+    for book in Book.objects.only('pk', 'isbn').order_by('pk').iterator(chunk_size=2000):
+        isbn13 = to_isbn13(book.isbn)
+        if isbn13 in seen:
+            # another spelling of a book already in the catalog; it stays
+            # unmatched until a librarian merges the two rows
+            isbn13 = None
+        seen.add(isbn13)
+        if isbn13:
+            book.isbn13 = isbn13
+            batch.append(book)
+        if len(batch) >= 500:
+            Book.objects.bulk_update(batch, ['isbn13'])
+            batch = []
+    Book.objects.bulk_update(batch, ['isbn13'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_book_metadata_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='isbn13',
+            field=models.CharField(blank=True, editable=False, max_length=13, null=True),
+        ),
+        migrations.RunPython(backfill_isbn13, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='book',
+            name='isbn13',
+            field=models.CharField(blank=True, editable=False, max_length=13, null=True, unique=True),
+        ),
+    ]
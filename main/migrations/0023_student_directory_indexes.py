@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+def install_prefix_indexes(apps, schema_editor):
+    from main import directory
+    directory.install(schema_editor.connection)
+
+
+def uninstall_prefix_indexes(apps, schema_editor):
+    from main import directory
+    directory.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_book_isbn13'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='student_name_idx'),
+        ),
+        migrations.RunPython(install_prefix_indexes, uninstall_prefix_indexes),
+    ]
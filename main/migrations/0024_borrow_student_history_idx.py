@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_student_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['student', '-borrowed_at', '-id'], name='borrow_student_history_idx'),
+        ),
+    ]
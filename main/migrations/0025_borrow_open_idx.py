@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0024_borrow_student_history_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(condition=models.Q(('returned_at__isnull', True)), fields=['-borrowed_at', '-id'], name='borrow_open_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-17 07:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0025_borrow_open_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCirculation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('dimension', models.CharField(choices=[('all', 'All loans'), ('book', 'Book'), ('language', 'Language'), ('year', 'Student year')], max_length=10)),
+                ('value', models.CharField(blank=True, max_length=20)),
+                ('loans', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('out', models.PositiveIntegerField(default=0)),
+                ('overdue', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['borrowed_at'], name='borrow_borrowed_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['returned_at'], name='borrow_returned_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailycirculation',
+            index=models.Index(fields=['dimension', 'day'], name='circulation_dimension_day_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailycirculation',
+            unique_together={('day', 'dimension', 'value')},
+        ),
+    ]
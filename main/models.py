@@ -1,13 +1,58 @@
 import re, datetime
-import isbnlib
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.dispatch import Signal
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.db.models.functions import Coalesce
+
+from .isbn import to_isbn13
 
 current_year = datetime.date.today().year
 
+LATE_FEE_PER_DAY = 1000  # $1 per day, in the units calculate_late_fee returns
+LOAN_DAYS = 15
+
+# Sent (after commit) when Book rows change through QuerySet.update() or bulk
+# operations, which skip post_save. ``book_ids`` lists every changed book;
+# ``now_available`` / ``now_unavailable`` the ones whose quantity crossed 0.
+books_updated = Signal()
+
+class CopyUnavailable(ValidationError):
+    """Raised by Book.borrow when every copy is already out."""
+
+class AlreadyBorrowed(ValidationError):
+    """Raised by Book.borrow when the student still has this book."""
+
+class UTCDate(models.Func):
+    """The UTC calendar date of a datetime, using the backend's native date math."""
+    arity = 1
+    output_field = models.DateField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template="(%(expressions)s AT TIME ZONE 'UTC')::date", **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # datetimes are stored as UTC ISO strings, which date() reads directly
+        return super().as_sql(compiler, connection, template='date(%(expressions)s)', **extra_context)
+
+class DaysBetween(models.Func):
+    """Whole days from the second date to the first (``end - start``)."""
+    arity = 2
+    output_field = models.IntegerField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL: date - date is already an integer number of days
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+            **extra_context
+        )
+
 class Student(models.Model):
     user = models.OneToOneField(
         User,
@@ -39,9 +84,21 @@ class Student(models.Model):
     student_id      = models.PositiveIntegerField(unique=True)
     email           = models.EmailField(unique=True)
 
+    class Meta:
+        indexes = [
+            # directory pages walk students in name order (the prefix-search
+            # indexes are backend-specific, see main/directory.py)
+            models.Index(fields=['last_name', 'first_name', 'id'], name='student_name_idx'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.middle_initial}. {self.last_name}"
 
+class BookQuerySet(models.QuerySet):
+    def by_isbn(self, *values):
+        """Books matching any of ``values``, in any ISBN-10/13 spelling."""
+        return self.filter(isbn13__in={to_isbn13(v) for v in values} - {None})
+
 class Book(models.Model):
     LANGUAGE_CHOICES = [
         ('en', 'English'), ('es', 'Spanish'), ('zh', 'Chinese'), ('hi', 'Hindi'),
@@ -54,6 +111,9 @@ class Book(models.Model):
     title               = models.CharField(max_length=100)
     author              = models.CharField(max_length=200, blank=True)
     isbn                = models.CharField(max_length=17, unique=True)
+    # canonical form of isbn (see main/isbn.py), what every lookup matches
+    # on; null only for legacy rows whose isbn is not a valid ISBN
+    isbn13              = models.CharField(max_length=13, unique=True, null=True, blank=True, editable=False)
     publisher           = models.CharField(max_length=100)
     year                = models.CharField(
                             max_length=4,
@@ -77,71 +137,174 @@ class Book(models.Model):
         upload_to='covers/', blank=True, null=True,
         help_text="Upload a cover image (optional)"
     )
+    # thumbnail/medium JPEG + WebP copies of cover, see main/covers.py
+    cover_variants      = models.JSONField(default=dict, blank=True, editable=False)
+
+    # bumped on every write to the book or its loans/reservations (ETags)
+    updated_at          = models.DateTimeField(auto_now=True)
+
+    # outcome of the background metadata check, see main/verification.py
+    METADATA_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('verified', 'Verified'),
+        ('mismatch', 'Mismatch'),
+    ]
+    metadata_status     = models.CharField(
+                            max_length=8, choices=METADATA_STATUS_CHOICES,
+                            default='pending', editable=False
+                         )
+    metadata_problems   = models.JSONField(default=list, blank=True, editable=False)
+    metadata_checked_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pages of a single facet value walk these in id order
+            models.Index(fields=['language', 'id'], name='book_language_idx'),
+            models.Index(fields=['publisher', 'id'], name='book_publisher_idx'),
+            models.Index(fields=['year', 'id'], name='book_year_idx'),
+            # the metadata review queue
+            models.Index(fields=['metadata_status', 'id'], name='book_metadata_status_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
     def clean(self):
-        # ISBN & metadata validation
+        # ISBN validation; the metadata comparison runs after the save, in
+        # the background (see main/verification.py)
         self.isbn = self.isbn.replace('-', '')
-        if not isbnlib.is_isbn10(self.isbn) and not isbnlib.is_isbn13(self.isbn):
+        self.isbn13 = to_isbn13(self.isbn)
+        if not self.isbn13:
             raise ValidationError("Invalid ISBN")
+        # the ISBN-10 and ISBN-13 of one book are the same book
+        if Book.objects.filter(isbn13=self.isbn13).exclude(pk=self.pk).exists():
+            raise ValidationError({'isbn': "A book with this ISBN already exists."})
         y = int(self.year)
         if y < 1300 or y > current_year:
             raise ValidationError("Year must be between 1300 and current year")
-        try:
-            meta = isbnlib.meta(self.isbn)
-            if meta['Title'] != self.title:
-                raise ValidationError("Title doesn’t match metadata")
-            user_authors = re.split(r',\s*', self.author)
-            if set(meta['Authors']) != set(user_authors):
-                raise ValidationError("Authors don’t match metadata")
-            if meta['Publisher'] != self.publisher:
-                raise ValidationError("Publisher doesn’t match metadata")
-            if str(meta.get('Year','')) != self.year:
-                raise ValidationError("Year doesn’t match metadata")
-            # note: isbnlib doesn’t provide language, skip that check or use Google API
-        except Exception as e:
-            raise ValidationError(f"Metadata check failed: {e}")
+
+    def save(self, *args, **kwargs):
+        self.isbn13 = to_isbn13(self.isbn)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'isbn' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'isbn13'}
+        super().save(*args, **kwargs)
+
+    def metadata_mismatches(self, meta):
+        """Where this book disagrees with ``meta`` (an isbnlib metadata dict)."""
+        if not meta:
+            return ["No metadata found for this ISBN."]
+        problems = []
+        if meta.get('Title') != self.title:
+            problems.append(f"Title doesn’t match metadata ({meta.get('Title')!r})")
+        user_authors = re.split(r',\s*', self.author)
+        if set(meta.get('Authors', [])) != set(user_authors):
+            problems.append(f"Authors don’t match metadata ({', '.join(meta.get('Authors', []))!r})")
+        if meta.get('Publisher') != self.publisher:
+            problems.append(f"Publisher doesn’t match metadata ({meta.get('Publisher')!r})")
+        if str(meta.get('Year', '')) != self.year:
+            problems.append(f"Year doesn’t match metadata ({meta.get('Year')!r})")
+        # note: isbnlib doesn’t provide language, skip that check or use Google API
+        return problems
 
     def borrow(self, student: Student):
-        #Check if student is already borrowing this book
-        if Borrow.objects.filter(student=student, book=self, returned_at__isnull=True).exists():
-            raise ValidationError("You already borrowed this book and haven't returned it.")
-
-        #Proceed only if available
-        if self.quantity > 0:
-            now = datetime.datetime.now()
-            self.quantity -= 1
-            self.is_borrowed = True
-            self.borrowed_by = student
-            self.borrowed_datetime = now
-            self.to_be_returned = now + datetime.timedelta(days=15)
-            self.save()
-
-            Borrow.objects.create(
-                student=student,
-                book=self,
-                borrowed_at=self.borrowed_datetime,
-                returned_due_date=self.to_be_returned
-            )
-        else:
-            # quantity == 0:
-            raise ValidationError("No copies available.")
+        """
+        Lend one copy to ``student`` and return the new Borrow.
+
+        The copy is taken with a conditional UPDATE (quantity > 0), so two
+        concurrent borrowers can never both get the last copy, and the
+        one-open-loan-per-student constraint on Borrow catches duplicates in
+        the same transaction. Raises CopyUnavailable or AlreadyBorrowed.
+        """
+        now = timezone.now()
+        due = now + datetime.timedelta(days=LOAN_DAYS)
+        try:
+            with transaction.atomic():
+                taken = Book.objects.filter(pk=self.pk, quantity__gt=0).update(
+                    quantity=models.F('quantity') - 1,
+                    is_borrowed=True,
+                    borrowed_by=student,
+                    borrowed_datetime=now,
+                    to_be_returned=due,
+                    updated_at=now,
+                )
+                if not taken:
+                    raise CopyUnavailable("No copies available.")
+                loan = Borrow.objects.create(
+                    student=student,
+                    book=self,
+                    borrowed_at=now,
+                    returned_due_date=due
+                )
+                self.quantity = Book.objects.values_list('quantity', flat=True).get(pk=self.pk)
+        except IntegrityError:
+            raise AlreadyBorrowed("You already borrowed this book and haven't returned it.")
+
+        self.is_borrowed, self.borrowed_by = True, student
+        self.borrowed_datetime, self.to_be_returned = now, due
+        self._send_updated(now_unavailable=[self.pk] if self.quantity == 0 else [])
+        return loan
 
     def return_book(self):
-        now = datetime.datetime.now()
-        self.returned_datetime = now
-        self.quantity += 1
-        self.is_borrowed = False
-        self.save()
+        now = timezone.now()
+        with transaction.atomic():
+            Book.objects.filter(pk=self.pk).update(
+                quantity=models.F('quantity') + 1,
+                is_borrowed=False,
+                returned_datetime=now,
+                updated_at=now,
+            )
+            self.quantity = Book.objects.values_list('quantity', flat=True).get(pk=self.pk)
+        self.returned_datetime, self.is_borrowed = now, False
+        self._send_updated(now_available=[self.pk] if self.quantity == 1 else [])
+
+        # Handing the copy to the next person in the queue happens in the
+        # background once this return commits; see main/reservations.py
+        from . import reservations
+        reservations.enqueue(self.pk)
+
+    def _send_updated(self, **changes):
+        transaction.on_commit(lambda: books_updated.send(sender=Book, book_ids=[self.pk], **changes))
 
 
-        next_person = self.reservation_set.order_by('reserved_at').first()
-        if next_person:
-            self.borrow(next_person.student)
-            next_person.delete()
+class BorrowQuerySet(models.QuerySet):
+    def open(self):
+        """Loans not yet returned (each one is a copy out of the library)."""
+        return self.filter(returned_at__isnull=True)
 
+    def overdue(self, min_days=1, now=None):
+        """
+        Loans still out at least ``min_days`` UTC calendar days past due.
+
+        Written as a plain range on returned_due_date (rather than a filter
+        on the computed days_late) so it can use borrow_open_due_idx.
+        """
+        now = now or timezone.now()
+        today = now.astimezone(datetime.timezone.utc).date()
+        cutoff = datetime.datetime.combine(
+            today - datetime.timedelta(days=max(min_days, 1) - 1),
+            datetime.time.min, tzinfo=datetime.timezone.utc,
+        )
+        return self.filter(returned_at__isnull=True, returned_due_date__lt=cutoff)
+
+    def with_late_fee(self, now=None):
+        """
+        Annotate ``days_late`` and ``late_fee`` in SQL, following the same
+        rule as Borrow.calculate_late_fee (UTC calendar days past the due
+        date, up to the return or ``now``).
+        """
+        now = now or timezone.now()
+        until = Coalesce('returned_at', models.Value(now, output_field=models.DateTimeField()))
+        return self.annotate(
+            days_late=DaysBetween(UTCDate(until), UTCDate('returned_due_date')),
+            late_fee=models.Case(
+                models.When(days_late__gt=0, then=models.F('days_late') * LATE_FEE_PER_DAY),
+                default=models.Value(0),
+                output_field=models.IntegerField(),
+            ),
+        )
 
 class Borrow(models.Model):
     student     = models.ForeignKey(Student, on_delete=models.CASCADE)
@@ -150,8 +313,36 @@ class Borrow(models.Model):
     returned_at = models.DateTimeField(null=True, blank=True)
     returned_due_date =models.DateTimeField()
 
+    objects = BorrowQuerySet.as_manager()
+
     class Meta:
         unique_together = ('student','book','borrowed_at')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['student', 'book'],
+                condition=models.Q(returned_at__isnull=True),
+                name='one_open_loan_per_student_book',
+            ),
+        ]
+        indexes = [
+            # overdue lookups only ever look at loans still out
+            models.Index(
+                fields=['returned_due_date'],
+                condition=models.Q(returned_at__isnull=True),
+                name='borrow_open_due_idx',
+            ),
+            # the librarian's list of loans still out, newest first
+            models.Index(
+                fields=['-borrowed_at', '-id'],
+                condition=models.Q(returned_at__isnull=True),
+                name='borrow_open_idx',
+            ),
+            # day ranges for the circulation rollups and term exports
+            models.Index(fields=['borrowed_at'], name='borrow_borrowed_at_idx'),
+            models.Index(fields=['returned_at'], name='borrow_returned_at_idx'),
+            # a student's dashboard history, newest first
+            models.Index(fields=['student', '-borrowed_at', '-id'], name='borrow_student_history_idx'),
+        ]
 
     def calculate_late_fee(self):
 
@@ -163,17 +354,177 @@ class Borrow(models.Model):
 
         days_late = (comparison_date.date() - self.returned_due_date.date()).days
         if days_late > 0:
-            return days_late * 1000  # $1 per day
+            return days_late * LATE_FEE_PER_DAY
         return 0
 
+class OverdueNotice(models.Model):
+    """Outbox row written by the overdue sweep; sent_at is set once mailed."""
+    borrow    = models.ForeignKey(Borrow, on_delete=models.CASCADE, related_name='overdue_notices')
+    run_date  = models.DateField()
+    days_late = models.PositiveIntegerField()
+    late_fee  = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at   = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # one notice per loan per sweep day, so a rerun never duplicates
+        unique_together = ('borrow', 'run_date')
+        indexes = [
+            models.Index(fields=['sent_at', 'id'], name='notice_outbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notice for loan {self.borrow_id} on {self.run_date}"
+
+class IsbnMetadata(models.Model):
+    """Cached provider answer for one ISBN-13; null data means "none found"."""
+    isbn13     = models.CharField(max_length=13, unique=True)
+    data       = models.JSONField(null=True, blank=True)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.isbn13
+
+class JobCheckpoint(models.Model):
+    """Where a resumable batch job got to: the last id it finished, per run."""
+    name      = models.CharField(max_length=50, unique=True)
+    run_date  = models.DateField()
+    last_id   = models.BigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    finished  = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} {self.run_date} @ {self.last_id}"
+
 class Reservation(models.Model):
     student   = models.ForeignKey(Student, on_delete=models.CASCADE)
     book      = models.ForeignKey(Book,    on_delete=models.CASCADE)
     reserved_at = models.DateTimeField(auto_now_add=True)
+    # set while a promotion worker holds this entry (non-PostgreSQL backends)
+    claimed_at  = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         unique_together = ('student', 'book')
         ordering = ['reserved_at']
+        indexes = [
+            models.Index(fields=['book', 'reserved_at'], name='reservation_queue_idx'),
+        ]
+
+class FacetCount(models.Model):
+    """Running per-value book counts behind the catalog filters."""
+    FACET_CHOICES = [
+        ('language', 'Language'),
+        ('decade', 'Decade'),
+        ('publisher', 'Publisher'),
+    ]
+
+    facet     = models.CharField(max_length=10, choices=FACET_CHOICES)
+    value     = models.CharField(max_length=100)
+    total     = models.IntegerField(default=0)
+    available = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('facet', 'value')
+
+    def __str__(self):
+        return f"{self.facet}={self.value} ({self.available}/{self.total})"
+
+class DailyCirculation(models.Model):
+    """
+    One day of circulation counts (UTC days), overall and per book, book
+    language and student year; maintained by the rollup_circulation command.
+    ``out`` and ``overdue`` are loans still out at the end of the day.
+    """
+    DIMENSION_CHOICES = [
+        ('all', 'All loans'),
+        ('book', 'Book'),
+        ('language', 'Language'),
+        ('year', 'Student year'),
+    ]
+
+    day       = models.DateField()
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    value     = models.CharField(max_length=20, blank=True)
+    loans     = models.PositiveIntegerField(default=0)
+    returns   = models.PositiveIntegerField(default=0)
+    out       = models.PositiveIntegerField(default=0)
+    overdue   = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('day', 'dimension', 'value')
+        indexes = [
+            # dashboard reads are one dimension over a range of days
+            models.Index(fields=['dimension', 'day'], name='circulation_dimension_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.dimension}={self.value} ({self.loans} loans)"
+
+class BookRecommendation(models.Model):
+    """One of a book's top co-borrowed neighbours (see main/recommendations.py)."""
+    book        = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommendations')
+    rank        = models.PositiveSmallIntegerField()
+    recommended = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    score       = models.FloatField()
+
+    class Meta:
+        # the (book, rank) index is the whole serving path
+        unique_together = ('book', 'rank')
+
+    def __str__(self):
+        return f"{self.book_id} #{self.rank}: {self.recommended_id} ({self.score:.3f})"
+
+class CatalogState(models.Model):
+    """Single-row version counter for the catalog as a whole (ETags)."""
+    version    = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def current(cls):
+        state = cls.objects.filter(pk=1).first()
+        return state or cls(pk=1)
+
+    @classmethod
+    def bump(cls):
+        now = timezone.now()
+        if not cls.objects.filter(pk=1).update(version=models.F('version') + 1, changed_at=now):
+            cls.objects.get_or_create(pk=1, defaults={'version': 1, 'changed_at': now})
+
+class RoleVersion(models.Model):
+    """Per-user counter bumped when a user's groups or profiles change (roles.py)."""
+    user    = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    version = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def current(cls, user_id):
+        return cls.objects.filter(pk=user_id).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, user_id):
+        if not cls.objects.filter(pk=user_id).update(version=models.F('version') + 1):
+            cls.objects.get_or_create(pk=user_id, defaults={'version': 1})
+
+class CacheVersion(models.Model):
+    """
+    Named counters that cached data is keyed on (dashboard summaries, the
+    recommendations). Kept here rather than in the cache so that a bump from
+    any worker or management command reaches every process.
+    """
+    name    = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def current(cls, *names):
+        """``{name: version}``, 0 for counters never bumped; one query."""
+        found = dict(cls.objects.filter(pk__in=names).values_list('name', 'version'))
+        return {name: found.get(name, 0) for name in names}
+
+    @classmethod
+    def bump(cls, *names):
+        existing = set(cls.objects.filter(pk__in=names).values_list('pk', flat=True))
+        cls.objects.filter(pk__in=existing).update(version=models.F('version') + 1)
+        cls.objects.bulk_create([cls(name=name, version=1) for name in set(names) - existing], ignore_conflicts=True)
 
 class Librarian(models.Model):
     user = models.OneToOneField(
@@ -197,7 +548,7 @@ class Librarian(models.Model):
 
     def add_book(self, title, author, isbn, publisher, year, language):
         """Method to add books."""
-        book = Book.objects.create(
+        book = Book(
             title=title,
             author=author,
             isbn=isbn,
@@ -205,15 +556,16 @@ class Librarian(models.Model):
             year=year,
             language=language
         )
+        # validate before the row exists, not after
         book.full_clean()
         book.save()
+        return book
 
     def remove_book(self, isbn):
         """Method to remove books."""
-        book = Book.objects.get(isbn=isbn)
+        book = Book.objects.by_isbn(isbn).get()
         book.delete()
 
     def view_borrowed_books(self):
-        """Method to view all borrowed books."""
-        borrowed_books = Book.objects.filter(is_borrowed=True)
-        return borrowed_books
\ No newline at end of file
+        """Method to view all borrowed books: one open Borrow per copy out."""
+        return Borrow.objects.open()
\ No newline at end of file
@@ -0,0 +1,94 @@
+import datetime
+from itertools import islice
+from django.conf import settings
+from django.core import mail
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Borrow, JobCheckpoint, OverdueNotice
+
+# The nightly overdue sweep. sweep() streams open overdue loans in primary
+# key order (a server-side cursor on PostgreSQL) and writes one outbox row
+# per loan and chunk, saving the last id it finished in a JobCheckpoint in
+# the same transaction, so an interrupted run resumes where it stopped and
+# memory use does not depend on how many loans are out. deliver() then
+# mails the unsent outbox rows through the configured EMAIL_BACKEND.
+
+SWEEP_JOB = 'overdue-sweep'
+
+
+def _checkpoint(run_date, restart=False):
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=SWEEP_JOB, defaults={'run_date': run_date})
+    if restart or checkpoint.run_date != run_date:
+        checkpoint.run_date = run_date
+        checkpoint.last_id = 0
+        checkpoint.processed = 0
+        checkpoint.finished = False
+        checkpoint.save()
+    return checkpoint
+
+
+def sweep(now=None, chunk_size=2000, restart=False, progress=None):
+    """
+    Record a notice for every loan overdue as of ``now``. Returns the
+    checkpoint; ``progress`` is called with it after each chunk.
+    """
+    now = now or timezone.now()
+    checkpoint = _checkpoint(now.astimezone(datetime.timezone.utc).date(), restart)
+    if checkpoint.finished:
+        return checkpoint
+
+    rows = (
+        Borrow.objects.overdue(now=now).with_late_fee(now)
+        .filter(pk__gt=checkpoint.last_id)
+        .order_by('pk')
+        .values_list('pk', 'days_late', 'late_fee')
+        .iterator(chunk_size=chunk_size)
+    )
+    while chunk := list(islice(rows, chunk_size)):
+        with transaction.atomic():
+            OverdueNotice.objects.bulk_create([
+                OverdueNotice(borrow_id=pk, run_date=checkpoint.run_date, days_late=days, late_fee=fee)
+                for pk, days, fee in chunk
+            ], ignore_conflicts=True)
+            checkpoint.last_id = chunk[-1][0]
+            checkpoint.processed += len(chunk)
+            checkpoint.save(update_fields=['last_id', 'processed', 'updated_at'])
+        if progress:
+            progress(checkpoint)
+
+    checkpoint.finished = True
+    checkpoint.save(update_fields=['finished', 'updated_at'])
+    return checkpoint
+
+
+def _message(notice):
+    borrow = notice.borrow
+    body = render_to_string('emails/overdue_notice.txt', {
+        'notice': notice,
+        'student': borrow.student,
+        'book': borrow.book,
+        'due': borrow.returned_due_date,
+    })
+    return mail.EmailMessage(
+        subject=f'Overdue: "{borrow.book.title}"',
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[borrow.student.email],
+    )
+
+
+def deliver(batch_size=100):
+    """Mail every unsent notice, ``batch_size`` per round trip. Returns the count sent."""
+    sent, last_id = 0, 0
+    pending = OverdueNotice.objects.filter(sent_at__isnull=True).select_related(
+        'borrow__student', 'borrow__book'
+    ).order_by('pk')
+    with mail.get_connection() as connection:
+        while batch := list(pending.filter(pk__gt=last_id)[:batch_size]):
+            last_id = batch[-1].pk
+            connection.send_messages([_message(notice) for notice in batch])
+            OverdueNotice.objects.filter(pk__in=[n.pk for n in batch]).update(sent_at=timezone.now())
+            sent += len(batch)
+    return sent
@@ -0,0 +1,122 @@
+import base64, datetime, json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class KeysetPage:
+    """One page of rows plus the cursors needed to move around it."""
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def _parse_ordering(model, ordering):
+    keys = []
+    for name in ordering:
+        desc = name.startswith('-')
+        name = name.lstrip('-')
+        field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        keys.append((name, desc, field))
+    return keys
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds datetimes to milliseconds, which would make
+    # the lt/gt filter skip rows that differ only in the microseconds
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _encode_cursor(direction, values):
+    raw = json.dumps([direction, values], cls=_CursorEncoder)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, keys):
+    # A tampered or stale cursor just means "start from the first page"
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('n', 'p') or len(values) != len(keys):
+            return None
+        return direction, [field.to_python(v) for (_, _, field), v in zip(keys, values)]
+    except Exception:
+        return None
+
+
+def _after(keys, values, backwards=False):
+    """Build the lexicographic "row comes after these key values" filter."""
+    condition = Q()
+    for i, (name, desc, _) in enumerate(keys):
+        lookup = 'lt' if desc != backwards else 'gt'
+        term = Q(**{f'{name}__{lookup}': values[i]})
+        for (prev_name, _, _), prev_value in zip(keys[:i], values[:i]):
+            term &= Q(**{prev_name: prev_value})
+        condition |= term
+    return condition
+
+
+def keyset_paginate(queryset, ordering, cursor=None, page_size=25):
+    """
+    Return a KeysetPage of ``queryset`` ordered by ``ordering``.
+
+    The ordering must end in a unique, non-null column (normally ``pk``) so
+    every row has a stable position. Each page is a single indexed range
+    scan of ``page_size + 1`` rows, so the cost does not grow with the table
+    the way OFFSET does.
+    """
+    keys = _parse_ordering(queryset.model, ordering)
+    decoded = _decode_cursor(cursor, keys) if cursor else None
+
+    if decoded and decoded[0] == 'p':
+        # Walk backwards from the cursor, then flip the rows back into order
+        reverse = [('' if desc else '-') + name for name, desc, _ in keys]
+        rows = list(queryset.filter(_after(keys, decoded[1], backwards=True))
+                            .order_by(*reverse)[:page_size + 1])
+        has_more = len(rows) > page_size
+        items = rows[:page_size][::-1]
+        has_before, has_after = has_more, True
+    else:
+        qs = queryset.order_by(*ordering)
+        if decoded:
+            qs = qs.filter(_after(keys, decoded[1]))
+        rows = list(qs[:page_size + 1])
+        items = rows[:page_size]
+        has_before, has_after = decoded is not None, len(rows) > page_size
+
+    def values_of(obj):
+        return [getattr(obj, name) for name, _, _ in keys]
+
+    next_cursor = _encode_cursor('n', values_of(items[-1])) if items and has_after else None
+    previous_cursor = _encode_cursor('p', values_of(items[0])) if items and has_before else None
+    return KeysetPage(items, next_cursor, previous_cursor)
+
+
+def page_size_from(request, default, maximum):
+    """Read an optional ``?size=`` override, clamped to ``maximum``."""
+    try:
+        size = int(request.GET.get('size', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
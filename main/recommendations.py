@@ -0,0 +1,158 @@
+from itertools import islice
+import numpy as np
+from django.db import transaction
+from django.db.models import Max, Subquery
+
+from .models import Borrow, BookRecommendation, CacheVersion
+
+# "Students who borrowed this also borrowed". build() works offline on
+# the (student, book) pairs of the whole Borrow history: the binary
+# student x book matrix is held as sorted index arrays, co-borrow counts
+# (the item-item product A^T A) are accumulated by pairing the books
+# within each student's history, and each count is scaled to a cosine
+# similarity. Only the top TOP_K neighbours per book are kept, in
+# BookRecommendation, so serving is one lookup on its (book, rank) index.
+# A rebuild bumps a CacheVersion in the same transaction; the book page's
+# ETag and the cached dashboard summaries include it.
+
+TOP_K = 10
+MIN_SUPPORT = 2          # students who must share a pair before it counts
+MAX_HISTORY = 200        # most recent distinct books per student considered
+PAIRS_PER_CHUNK = 5_000_000   # bounds the working arrays to a few hundred MB
+VERSION_KEY = 'recommendations'
+
+
+def load_pairs(chunk_size=100_000):
+    """Distinct (student, book) index arrays, newest loans first per student."""
+    rows = (
+        Borrow.objects.values('student_id', 'book_id')
+        .annotate(last=Max('borrowed_at')).order_by()
+        .values_list('student_id', 'book_id', 'last')
+        .iterator(chunk_size=chunk_size)
+    )
+    students, books, when = [], [], []
+    while chunk := list(islice(rows, chunk_size)):
+        s, b, w = zip(*chunk)
+        students.append(np.array(s, dtype=np.int64))
+        books.append(np.array(b, dtype=np.int64))
+        when.append(np.array([t.timestamp() for t in w], dtype=np.float64))
+    if not students:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    students, books, when = map(np.concatenate, (students, books, when))
+    order = np.lexsort((-when, students))
+    return students[order], books[order]
+
+
+def _cooccurrence(students, items, n_items, max_history):
+    """Co-borrow counts as (sorted pair keys ``a * n_items + b``, counts)."""
+    _, starts, sizes = np.unique(students, return_index=True, return_counts=True)
+    # keep each student's most recent max_history books (pairs grow as n^2)
+    rank = np.arange(len(items)) - np.repeat(starts, sizes)
+    keep = rank < max_history
+    items = items[keep]
+    sizes = np.minimum(sizes, max_history)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    keys, counts = [], []
+    group = 0
+    while group < len(sizes):
+        # as many students as fit in one chunk of pairs
+        pairs = np.cumsum(sizes[group:] ** 2)
+        stop = group + max(1, int(np.searchsorted(pairs, PAIRS_PER_CHUNK, side='right')))
+        lo, hi = starts[group], starts[stop - 1] + sizes[stop - 1]
+        member = items[lo:hi]
+        size = np.repeat(sizes[group:stop], sizes[group:stop])
+        first = np.repeat(starts[group:stop] - lo, sizes[group:stop])
+        # each book paired with every book of its student's (capped) history
+        left = np.repeat(member, size)
+        offset = np.arange(len(left)) - np.repeat(np.cumsum(size) - size, size)
+        right = member[np.repeat(first, size) + offset]
+        pair = left * n_items + right
+        unique, count = np.unique(pair[left != right], return_counts=True)
+        keys.append(unique)
+        counts.append(count)
+        group = stop
+
+    keys, counts = np.concatenate(keys), np.concatenate(counts)
+    if not len(keys):
+        return keys, counts
+    order = np.argsort(keys, kind='stable')
+    keys, counts = keys[order], counts[order]
+    boundaries = np.flatnonzero(np.diff(keys)) + 1
+    starts = np.concatenate(([0], boundaries))
+    return keys[starts], np.add.reduceat(counts, starts)
+
+
+def build(students, books, top_k=TOP_K, min_support=MIN_SUPPORT, max_history=MAX_HISTORY):
+    """
+    Top-``top_k`` cosine neighbours per book from (student, book) pairs.
+    Returns parallel arrays (book, rank, neighbour, score).
+    """
+    empty = np.empty(0, np.int64)
+    if not len(books):
+        return empty, empty, empty, np.empty(0)
+    book_ids, items = np.unique(books, return_inverse=True)
+    n_items = len(book_ids)
+    degree = np.bincount(items, minlength=n_items)  # students per book
+
+    keys, counts = _cooccurrence(students, items, n_items, max_history)
+    keep = counts >= min_support
+    keys, counts = keys[keep], counts[keep]
+    a, b = keys // n_items, keys % n_items
+    score = counts / np.sqrt(degree[a] * degree[b])
+
+    # best first within each book (ties: more shared students, lower id)
+    order = np.lexsort((b, -counts, -score, a))
+    a, b, score = a[order], b[order], score[order]
+    starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]])
+    rank = np.arange(len(a)) - np.repeat(starts, np.diff(np.r_[starts, len(a)]))
+    top = rank < top_k
+    return book_ids[a[top]], rank[top], book_ids[b[top]], score[top]
+
+
+def store(book, rank, neighbour, score, batch_size=5000):
+    """Replace every stored recommendation in one transaction."""
+    with transaction.atomic():
+        BookRecommendation.objects.all().delete()
+        BookRecommendation.objects.bulk_create(
+            (BookRecommendation(book_id=int(x), rank=int(r), recommended_id=int(y), score=float(s))
+             for x, r, y, s in zip(book, rank, neighbour, score)),
+            batch_size=batch_size,
+        )
+        CacheVersion.bump(VERSION_KEY)
+    return len(book)
+
+
+def version():
+    return CacheVersion.current(VERSION_KEY)[VERSION_KEY]
+
+
+def for_book(book_id, limit=TOP_K):
+    """The stored neighbours of one book, best first."""
+    return list(
+        BookRecommendation.objects.filter(book_id=book_id, rank__lt=limit)
+        .order_by('rank')
+        .values('recommended_id', 'recommended__title', 'recommended__author', 'score')
+    )
+
+
+def for_student(student_id, recent=5, limit=6):
+    """
+    Neighbours of the student's ``recent`` latest loans that they have not
+    borrowed yet, best score first; one query.
+    """
+    history = Borrow.objects.filter(student_id=student_id)
+    latest = history.order_by('-borrowed_at', '-pk').values('book_id')[:recent]
+    rows = (
+        BookRecommendation.objects
+        .filter(book_id__in=Subquery(latest))
+        .exclude(recommended_id__in=Subquery(history.values('book_id')))
+        .order_by('-score', 'rank')
+        .values('recommended_id', 'recommended__title', 'recommended__author', 'score')[:limit * recent]
+    )
+    seen, picked = set(), []
+    for row in rows:
+        if row['recommended_id'] not in seen:
+            seen.add(row['recommended_id'])
+            picked.append(row)
+    return picked[:limit]
@@ -0,0 +1,97 @@
+import datetime
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from . import tasks
+from .models import AlreadyBorrowed, Book, CopyUnavailable, Reservation
+
+# Promotes the head of a book's reservation queue to a loan whenever copies
+# are on the shelf. Queue heads are claimed with SELECT ... FOR UPDATE SKIP
+# LOCKED on PostgreSQL, so concurrent workers split the queue instead of
+# promoting the same student twice. Other backends claim entries with a
+# conditional UPDATE of Reservation.claimed_at, which has the same effect.
+# Students borrowing from the book page go through ahead_of() so a freed
+# copy is never taken by someone behind the queue.
+
+CLAIM_TIMEOUT = datetime.timedelta(minutes=5)
+
+
+def enqueue(book_id):
+    """Promote waiting students for ``book_id`` once the current transaction commits."""
+    transaction.on_commit(lambda: tasks.submit(promote, book_id))
+
+
+def ahead_of(book_id, student):
+    """
+    Reservations of ``book_id`` queued before ``student``: the whole queue
+    for a student who is not in it.
+    """
+    queue = Reservation.objects.filter(book_id=book_id).exclude(student=student)
+    own = Reservation.objects.filter(book_id=book_id, student=student).first()
+    if own:
+        queue = queue.filter(Q(reserved_at__lt=own.reserved_at)
+                             | Q(reserved_at=own.reserved_at, pk__lt=own.pk))
+    return queue
+
+
+def held_for_others(book_ids, student):
+    """The subset of ``book_ids`` with someone queued before ``student``; one query."""
+    mine_first = Reservation.objects.filter(student=student, book=OuterRef('book')).filter(
+        Q(reserved_at__lt=OuterRef('reserved_at')) | Q(reserved_at=OuterRef('reserved_at'), pk__lt=OuterRef('pk'))
+    )
+    return set(
+        Reservation.objects.filter(book__in=book_ids).exclude(student=student)
+        .exclude(Exists(mine_first)).values_list('book_id', flat=True).distinct()
+    )
+
+
+def _claim(book_id, limit):
+    queue = Reservation.objects.filter(book_id=book_id).order_by('reserved_at', 'pk')
+    if connection.features.has_select_for_update_skip_locked:
+        return list(queue.select_for_update(skip_locked=True, of=('self',)).select_related('student')[:limit])
+
+    now = timezone.now()
+    claimable = Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - CLAIM_TIMEOUT)
+    claimed = [
+        pk for pk in queue.filter(claimable).values_list('pk', flat=True)[:limit]
+        if Reservation.objects.filter(claimable, pk=pk).update(claimed_at=now)
+    ]
+    return list(Reservation.objects.filter(pk__in=claimed).order_by('reserved_at', 'pk').select_related('student'))
+
+
+def promote(book_id):
+    """Turn as many queued reservations into loans as there are free copies."""
+    promoted = 0
+    while True:
+        with transaction.atomic():
+            book = Book.objects.filter(pk=book_id).first()
+            if book is None or book.quantity == 0:
+                return promoted
+            batch = _claim(book_id, book.quantity)
+            if not batch:
+                return promoted
+
+            done, release = [], []
+            for reservation in batch:
+                try:
+                    book.borrow(reservation.student)
+                    promoted += 1
+                except AlreadyBorrowed:
+                    pass  # they already have a copy; their place is used up
+                except CopyUnavailable:
+                    release.append(reservation.pk)
+                    continue
+                done.append(reservation.pk)
+
+            Reservation.objects.filter(pk__in=done).delete()
+            Reservation.objects.filter(pk__in=release).update(claimed_at=None)
+            if release:
+                return promoted
+
+
+def promote_all():
+    """Sweep every book that has both free copies and a queue."""
+    book_ids = (Book.objects.filter(quantity__gt=0, reservation__isnull=False)
+                            .values_list('pk', flat=True).distinct())
+    return sum(promote(book_id) for book_id in list(book_ids))
@@ -0,0 +1,100 @@
+from functools import wraps
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.utils.functional import cached_property
+
+# A user's role ("Student" / "Librarian") and profile ids are looked up once
+# and kept in their session. Group or profile changes bump the user's
+# RoleVersion row (see signals.py), which makes the next request in any
+# process resolve the role again; checking it is one primary key lookup.
+
+SESSION_KEY = '_library_role'
+ROLES = ('Student', 'Librarian')
+
+
+class Role:
+    def __init__(self, name=None, student_id=None, librarian_id=None):
+        self.name = name
+        self.student_id = student_id
+        self.librarian_id = librarian_id
+
+    @property
+    def is_student(self):
+        return self.name == 'Student'
+
+    @property
+    def is_librarian(self):
+        return self.name == 'Librarian'
+
+    @cached_property
+    def student(self):
+        from .models import Student
+        return Student.objects.get(pk=self.student_id) if self.student_id else None
+
+    @cached_property
+    def librarian(self):
+        from .models import Librarian
+        return Librarian.objects.get(pk=self.librarian_id) if self.librarian_id else None
+
+
+ANONYMOUS = Role()
+
+
+def invalidate(user_id):
+    """Make every session of ``user_id`` resolve its role again."""
+    from .models import RoleVersion
+    RoleVersion.bump(user_id)
+
+
+def resolve(user):
+    """Look the role up in the database (three small indexed queries)."""
+    from .models import Librarian, Student
+
+    if not user.is_authenticated:
+        return ANONYMOUS
+    groups = set(user.groups.filter(name__in=ROLES).values_list('name', flat=True))
+    name = next((role for role in ROLES if role in groups), None)
+    return Role(
+        name=name,
+        student_id=Student.objects.filter(user=user).values_list('pk', flat=True).first(),
+        librarian_id=Librarian.objects.filter(user=user).values_list('pk', flat=True).first(),
+    )
+
+
+def get_role(request):
+    """The request user's Role, from the session when it is still current."""
+    user = request.user
+    if not user.is_authenticated:
+        return ANONYMOUS
+
+    from .models import RoleVersion
+    version = RoleVersion.current(user.pk)
+    stored = request.session.get(SESSION_KEY)
+    if stored and stored['user'] == user.pk and stored['version'] == version:
+        return Role(stored['name'], stored['student'], stored['librarian'])
+
+    role = resolve(user)
+    request.session[SESSION_KEY] = {
+        'user': user.pk,
+        'version': version,
+        'name': role.name,
+        'student': role.student_id,
+        'librarian': role.librarian_id,
+    }
+    return role
+
+
+def role_required(name):
+    """Like user_passes_test, but checks the role cached on the request."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.role.name == name:
+                return view(request, *args, **kwargs)
+            return redirect_to_login(request.get_full_path())
+        return login_required(wrapper)
+    return decorator
+
+
+student_required = role_required('Student')
+librarian_required = role_required('Librarian')
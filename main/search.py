@@ -0,0 +1,140 @@
+import re
+from django.db import connection as default_connection
+
+# Full-text index over Book.title, Book.author and Book.publisher.
+#
+# PostgreSQL: a stored, generated tsvector column with a GIN index, so the
+# database keeps it current on every INSERT/UPDATE/DELETE.
+# SQLite: an external-content FTS5 table kept in step with main_book by
+# triggers. Either way every write path (the admin, new_book,
+# Librarian.add_book, import_books' bulk inserts) updates the index without
+# any Python-side bookkeeping.
+
+PG_INSTALL = [
+    """
+    ALTER TABLE main_book ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(author, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(publisher, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS main_book_search_idx ON main_book USING gin (search_vector)",
+]
+
+PG_UNINSTALL = [
+    "DROP INDEX IF EXISTS main_book_search_idx",
+    "ALTER TABLE main_book DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS main_book_fts_ai AFTER INSERT ON main_book BEGIN
+        INSERT INTO main_book_fts(rowid, title, author, publisher)
+        VALUES (new.id, new.title, new.author, new.publisher);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS main_book_fts_ad AFTER DELETE ON main_book BEGIN
+        INSERT INTO main_book_fts(main_book_fts, rowid, title, author, publisher)
+        VALUES ('delete', old.id, old.title, old.author, old.publisher);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS main_book_fts_au AFTER UPDATE OF title, author, publisher ON main_book BEGIN
+        INSERT INTO main_book_fts(main_book_fts, rowid, title, author, publisher)
+        VALUES ('delete', old.id, old.title, old.author, old.publisher);
+        INSERT INTO main_book_fts(rowid, title, author, publisher)
+        VALUES (new.id, new.title, new.author, new.publisher);
+    END
+    """,
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS main_book_fts_ai",
+    "DROP TRIGGER IF EXISTS main_book_fts_ad",
+    "DROP TRIGGER IF EXISTS main_book_fts_au",
+    "DROP TABLE IF EXISTS main_book_fts",
+]
+
+
+def install(connection=default_connection):
+    """Create (or repair) the full-text index. Safe to run repeatedly."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in PG_INSTALL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            # SQLite migrations rebuild main_book by copy-and-rename, which
+            # silently drops its triggers, so check and rebuild if needed.
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'main_book_fts_%'"
+            )
+            if cursor.fetchone()[0] == len(SQLITE_TRIGGERS):
+                return
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS main_book_fts USING fts5("
+                "title, author, publisher, content='main_book', content_rowid='id', "
+                "tokenize='porter unicode61')"
+            )
+            for sql in SQLITE_TRIGGERS:
+                cursor.execute(sql)
+            cursor.execute("INSERT INTO main_book_fts(main_book_fts) VALUES ('rebuild')")
+
+
+def uninstall(connection=default_connection):
+    statements = {'postgresql': PG_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def _terms(query):
+    # Only plain word characters reach the engine, so user input can never
+    # be read as tsquery / FTS5 query syntax.
+    return re.findall(r'\w+', query.lower())[:10]
+
+
+def ranked_ids(query, limit, offset=0, connection=default_connection):
+    """Return Book ids matching ``query``, best match first."""
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == 'postgresql':
+        sql = (
+            "SELECT id FROM main_book, to_tsquery('english', %s) query "
+            "WHERE search_vector @@ query "
+            "ORDER BY ts_rank_cd(search_vector, query) DESC, id "
+            "LIMIT %s OFFSET %s"
+        )
+        params = [' & '.join(f'{t}:*' for t in terms), limit, offset]
+    elif connection.vendor == 'sqlite':
+        # bm25 weights mirror the A/B/C weights used on PostgreSQL
+        sql = (
+            "SELECT rowid FROM main_book_fts WHERE main_book_fts MATCH %s "
+            "ORDER BY bm25(main_book_fts, 10.0, 4.0, 1.0), rowid "
+            "LIMIT %s OFFSET %s"
+        )
+        params = [' '.join(f'"{t}"*' for t in terms), limit, offset]
+    else:
+        raise NotImplementedError(f"Full-text search is not set up for {connection.vendor}")
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_books(queryset, query, page=1, page_size=24):
+    """
+    Return ``(books, has_next)`` for one page of ranked results.
+
+    ``queryset`` controls which columns are loaded; the ranking itself comes
+    from the index and only the ids of the requested page are fetched.
+    """
+    offset = (page - 1) * page_size
+    ids = ranked_ids(query, page_size + 1, offset)
+    has_next = len(ids) > page_size
+    ids = ids[:page_size]
+    books = queryset.in_bulk(ids)
+    return [books[i] for i in ids if i in books], has_next
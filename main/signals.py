@@ -0,0 +1,126 @@
+import logging
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import covers, dashboard, facets, roles, verification
+from .models import Book, Borrow, CatalogState, Librarian, Reservation, Student, books_updated
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Book)
+def build_cover_variants(sender, instance, raw, **kwargs):
+    # The save may already be committed, so the variants move updated_at
+    # again: a card rendered in between must not outlive them.
+    if raw or not covers.needs_variants(instance):
+        return
+    variants = {}
+    if instance.cover:
+        try:
+            variants = covers.build_variants(settings.MEDIA_ROOT, instance.cover.name)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not build cover variants for book %s: %s", instance.pk, e)
+    instance.cover_variants, instance.updated_at = variants, timezone.now()
+    Book.objects.filter(pk=instance.pk).update(cover_variants=variants, updated_at=instance.updated_at)
+
+
+@receiver(pre_save, sender=Book)
+def remember_facet_state(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    old = None
+    if instance.pk is not None:
+        old = Book.objects.filter(pk=instance.pk).values(*facets.FACET_FIELDS, *verification.CHECKED_FIELDS).first()
+    instance._facet_state = facets.snapshot(old) if old else None
+    # new or edited details have to be checked against the metadata again
+    instance._needs_verification = old is None or any(
+        old[name] != getattr(instance, name) for name in verification.CHECKED_FIELDS
+    )
+    if instance._needs_verification:
+        instance.metadata_status = 'pending'
+        instance.metadata_problems = []
+
+
+@receiver(post_save, sender=Book)
+def update_facets_on_save(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    old_state = getattr(instance, '_facet_state', None)
+    new_state = facets.snapshot(instance)
+    if old_state != new_state:
+        facets.apply(facets.change_deltas(old_state, new_state))
+    CatalogState.bump()
+    if getattr(instance, '_needs_verification', False):
+        verification.enqueue(instance.pk)
+
+
+@receiver(post_delete, sender=Book)
+def update_facets_on_delete(sender, instance, **kwargs):
+    facets.apply(facets.deltas_for(facets.snapshot(instance), -1))
+    CatalogState.bump()
+
+
+@receiver(books_updated)
+def refresh_after_queryset_update(sender, book_ids, now_available=(), now_unavailable=(), **kwargs):
+    # Same bookkeeping as the post_save receivers, for writes that skip them
+    CatalogState.bump()
+    if now_available or now_unavailable:
+        available = set(now_available)
+        rows = list(Book.objects.filter(pk__in=[*now_available, *now_unavailable]).values('pk', *facets.FACET_FIELDS))
+        deltas = facets.availability_deltas([r for r in rows if r['pk'] in available], +1)
+        deltas.update(facets.availability_deltas([r for r in rows if r['pk'] not in available], -1))
+        facets.apply(deltas)
+
+
+@receiver(post_save, sender=Borrow)
+@receiver(post_delete, sender=Borrow)
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def touch_book(sender, instance, raw=False, **kwargs):
+    # The book page shows loan history and the viewer's borrow/reserve state,
+    # so its ETag has to move when either changes.
+    if not raw:
+        Book.objects.filter(pk=instance.book_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Borrow)
+@receiver(post_delete, sender=Borrow)
+@receiver(post_save, sender=Reservation)
+def invalidate_student_summary(sender, instance, raw=False, **kwargs):
+    if not raw:
+        dashboard.invalidate(instance.student_id)
+
+
+@receiver(post_delete, sender=Reservation)
+def invalidate_queue_summaries(sender, instance, **kwargs):
+    # everyone behind the deleted entry moves up one place
+    dashboard.invalidate(instance.student_id)
+    dashboard.invalidate_queue(instance.book_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_role_on_group_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == 'pre_clear':
+        user_ids = list(instance.user_set.values_list('pk', flat=True))
+    else:
+        user_ids = pk_set or []
+    for user_id in user_ids:
+        roles.invalidate(user_id)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Librarian)
+@receiver(post_delete, sender=Librarian)
+def invalidate_role_on_profile_change(sender, instance, created=True, origin=None, **kwargs):
+    # only creating or deleting a profile changes which one a user has; a
+    # profile deleted along with its user leaves no sessions to update
+    if created and getattr(origin, 'model', type(origin)) is not User:
+        roles.invalidate(instance.user_id)
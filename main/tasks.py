@@ -0,0 +1,35 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+
+# Minimal in-process background work queue. BACKGROUND_TASKS selects:
+#   'thread' - run on a small thread pool after the request returns
+#   'sync'   - run immediately (tests, management commands)
+#   'off'    - do nothing; a periodic management command picks the work up
+
+logger = logging.getLogger(__name__)
+_executor = None
+
+
+def _run(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Background task %s%r failed", func.__name__, args)
+    finally:
+        connection.close()
+
+
+def submit(func, *args):
+    global _executor
+    mode = settings.BACKGROUND_TASKS
+    if mode == 'sync':
+        func(*args)
+    elif mode == 'thread':
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_TASK_WORKERS,
+                thread_name_prefix='library-task',
+            )
+        _executor.submit(_run, func, args)
@@ -0,0 +1,36 @@
+from django import template
+from django.core.files.storage import default_storage
+from main import cards, covers
+
+register = template.Library()
+
+
+@register.simple_tag
+def book_cards(books):
+    """Render the catalog card for each book, served from the card cache."""
+    return cards.render_cards(books)
+
+
+def _variants(book):
+    return book.cover_variants if book.cover and book.cover_variants else {}
+
+
+@register.simple_tag
+def cover_url(book, size='medium'):
+    """URL of one cover size, falling back to the original upload."""
+    variant = _variants(book).get(size)
+    if variant:
+        return default_storage.url(variant['jpeg'])
+    return book.cover.url if book.cover else ''
+
+
+@register.simple_tag
+def cover_srcset(book, fmt='jpeg'):
+    """``srcset`` value listing every generated size of the cover in ``fmt``."""
+    variants = _variants(book)
+    entries = {}
+    for size in covers.SIZES:
+        if size in variants:
+            # small originals come out the same width at every size
+            entries.setdefault(variants[size]['width'], default_storage.url(variants[size][fmt]))
+    return ', '.join(f"{url} {width}w" for width, url in entries.items())
@@ -1,3 +1,1154 @@
-from django.test import TestCase
+import csv, datetime, io, json, os, shutil, tempfile, threading, time
+import isbnlib
+import numpy as np
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.contrib.messages import get_messages
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from . import analytics, cards, circulation, covers, dashboard, directory, dumps, facets, fees, metadata, notices, recommendations, reservations, search, verification
+from .models import AlreadyBorrowed, Book, Borrow, CatalogState, DailyCirculation, FacetCount, IsbnMetadata, JobCheckpoint, Librarian, OverdueNotice, Reservation, RoleVersion, Student
+from .pagination import keyset_paginate
+
+
+def make_student(n):
+    user = User.objects.create_user(username=f"student{n}@students.kennesaw.edu")
+    user.groups.add(Group.objects.get_or_create(name='Student')[0])
+    return Student.objects.create(
+        user=user, first_name=f"First{n}", last_name=f"Last{n}", sex='F',
+        year='FR', student_id=1000 + n, email=user.username,
+    )
+
+
+def isbn_for(n):
+    stem = f"978000{n:06d}"
+    return stem + isbnlib.check_digit13(stem)
+
+
+def make_book(n=0, **fields):
+    defaults = dict(
+        title=f"Book {n}", author="Author", isbn=isbn_for(n),
+        publisher="Publisher", year="2000", language='en', quantity=1,
+    )
+    defaults.update(fields)
+    return Book.objects.create(**defaults)
+
+
+def make_librarian():
+    user = User.objects.create_user(username="lib@staff.kennesaw.edu")
+    user.groups.add(Group.objects.get_or_create(name='Librarian')[0])
+    Librarian.objects.create(
+        user=user, first_name="Lib", last_name="Rarian", sex='M',
+        staff_id=1, email=user.username,
+    )
+    return user
+
+
+def make_loan_history(book, count=30):
+    """Loans of ``book`` over the last 40 days; every third is still out."""
+    now = timezone.now()
+    for n in range(count):
+        borrowed = now - datetime.timedelta(days=40 - n)
+        Borrow.objects.create(
+            student=make_student(n), book=book, borrowed_at=borrowed,
+            returned_due_date=borrowed + datetime.timedelta(days=15),
+            returned_at=borrowed + datetime.timedelta(days=n) if n % 3 else None,
+        )
+
+
+FAKE_LATENCY = 0.05
+
+
+def fake_provider(isbn):
+    """Local stand-in for isbnlib.meta with a network-like delay."""
+    time.sleep(FAKE_LATENCY)
+    return {
+        'Title': f"Title {isbn}", 'Authors': ["A. Writer"], 'Publisher': "Press",
+        'Year': "2001", 'Language': "EN",
+    }
+
+
+def broken_provider(isbn):
+    raise OSError("network unreachable")
+
+
+# a local cache of its own, like another worker process or a management command
+OTHER_PROCESS = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'other-process'}}
+
+
+provider_calls = []
+
+
+def recording_provider(isbn):
+    """fake_provider that also notes every ISBN it is asked for."""
+    provider_calls.append(isbn)
+    return fake_provider(isbn)
+
+
+class BorrowHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_librarian()
+        cls.book = make_book()
+        make_loan_history(cls.book)
+
+    def setUp(self):
+        self.client.force_login(self.librarian)
+        # the first request also resolves and stores the user's role
+        self.client.get(reverse('books'))
+
+    def history_queries(self, page_size):
+        with override_settings(BORROW_HISTORY_PAGE_SIZE=page_size):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('book', args=[self.book.id]))
+        self.assertEqual(len(response.context['borrow_records']), page_size)
+        return len(queries)
+
+    def test_history_query_count_does_not_grow_with_page_size(self):
+        self.assertEqual(self.history_queries(5), self.history_queries(25))
+
+    def test_sql_late_fee_matches_python_rule(self):
+        for record in Borrow.objects.with_late_fee():
+            self.assertEqual(record.late_fee, record.calculate_late_fee())
+
+
+class LateFeeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = make_book()
+        make_loan_history(cls.book)
+
+    def test_numpy_late_fee_matches_python_rule(self):
+        loans = list(Borrow.objects.all())
+        computed = fees.late_fees([b.returned_due_date for b in loans], [b.returned_at for b in loans])
+        self.assertEqual(list(computed), [b.calculate_late_fee() for b in loans])
+
+    def test_queryset_late_fees_streams_in_chunks(self):
+        expected = {b.pk: b.calculate_late_fee() for b in Borrow.objects.all()}
+        chunks = list(fees.queryset_late_fees(Borrow.objects.all(), chunk_size=7))
+        self.assertEqual([len(ids) for ids, _ in chunks], [7, 7, 7, 7, 2])
+        self.assertEqual({int(pk): int(fee) for ids, amounts in chunks for pk, fee in zip(ids, amounts)}, expected)
+
+    def test_overdue_filter_agrees_with_days_late(self):
+        for min_days in (1, 5, 20):
+            expected = {
+                b.pk for b in Borrow.objects.with_late_fee()
+                if b.returned_at is None and b.days_late >= min_days
+            }
+            self.assertEqual(set(Borrow.objects.overdue(min_days).values_list('pk', flat=True)), expected)
+
+
+class BorrowedBooksReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_librarian()
+        cls.book = make_book()
+        make_loan_history(cls.book)
+
+    def setUp(self):
+        self.client.force_login(self.librarian)
+        # the first request also resolves and stores the user's role
+        self.client.get(reverse('books'))
+
+    def test_borrowed_books_lists_and_exports_open_loans(self):
+        url = reverse('librarian_borrowed_books')
+        open_loans = set(Borrow.objects.open().values_list('pk', flat=True))
+        response = self.client.get(url)
+        self.assertEqual({loan.pk for loan in response.context['page']}, open_loans)
+
+        response = self.client.get(url, {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual({int(row['loan_id']) for row in rows}, open_loans)
+
+        response = self.client.get(url, {'format': 'json', 'returned': '1'})
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), Borrow.objects.count())
+        self.assertEqual(sum(row['late_fee'] for row in rows), sum(b.calculate_late_fee() for b in Borrow.objects.all()))
+
+
+class CirculationAnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_librarian()
+        cls.book = make_book()
+        make_loan_history(cls.book)
+
+    def setUp(self):
+        self.client.force_login(self.librarian)
+        # the first request also resolves and stores the user's role
+        self.client.get(reverse('books'))
+
+    def test_rollups_match_loans_whatever_the_chunking(self):
+        now = timezone.now()
+        columns = ('day', 'dimension', 'value', 'loans', 'returns', 'out', 'overdue')
+        analytics.rollup(now, chunk_days=31)
+        coarse = set(DailyCirculation.objects.values_list(*columns))
+        analytics.rollup(now, chunk_days=4, restart=True)
+        self.assertEqual(set(DailyCirculation.objects.values_list(*columns)), coarse)
+
+        utc = lambda value: value.astimezone(datetime.timezone.utc).date() if value else None
+        loans = [(utc(b.borrowed_at), utc(b.returned_at), utc(b.returned_due_date)) for b in Borrow.objects.all()]
+        for row in DailyCirculation.objects.filter(dimension='all'):
+            out = [loan for loan in loans if loan[0] <= row.day and (loan[1] is None or loan[1] > row.day)]
+            self.assertEqual(row.loans, sum(loan[0] == row.day for loan in loans))
+            self.assertEqual(row.returns, sum(loan[1] == row.day for loan in loans))
+            self.assertEqual((row.out, row.overdue), (len(out), sum(loan[2] < row.day for loan in out)))
+
+        response = self.client.get(reverse('librarian_dashboard'), {'days': 30})
+        self.assertEqual(response.context['analytics']['loans'], sum(loan[0] > utc(now) - datetime.timedelta(days=30) for loan in loans))
+        self.assertEqual(response.context['analytics']['top_titles'][0]['book_id'], self.book.pk)
+
+
+class KeysetPaginationTests(TestCase):
+    def test_pages_over_equal_and_sub_millisecond_datetimes(self):
+        book = make_book()
+        base = timezone.now().replace(microsecond=500000)
+        # three loans in the same microsecond (a bulk checkout), three more
+        # apart by less than a millisecond
+        stamps = [base] * 3 + [base + datetime.timedelta(microseconds=n) for n in (1, 2, 3)]
+        for n, borrowed in enumerate(stamps):
+            Borrow.objects.create(student=make_student(n), book=book, borrowed_at=borrowed,
+                                  returned_due_date=borrowed, returned_at=borrowed)
+        expected = list(Borrow.objects.order_by('-borrowed_at', '-pk').values_list('pk', flat=True))
+
+        pages, cursor = [], None
+        while True:
+            page = keyset_paginate(Borrow.objects.all(), ('-borrowed_at', '-pk'), cursor, page_size=2)
+            pages.append([loan.pk for loan in page])
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(sum(pages, []), expected)
+
+        back = [pages[-1]]
+        while page.has_previous:
+            page = keyset_paginate(Borrow.objects.all(), ('-borrowed_at', '-pk'), page.previous_cursor, page_size=2)
+            back.insert(0, [loan.pk for loan in page])
+        self.assertEqual(back, pages)
+
+
+# no follow-up tasks (metadata checks, promotions) outliving the test's tables
+@override_settings(BACKGROUND_TASKS='off')
+class FacetCountTests(TestCase):
+    def assertMatchesRecount(self):
+        columns = ('facet', 'value', 'total', 'available')
+        kept = set(FacetCount.objects.values_list(*columns))
+        facets.rebuild()
+        self.assertEqual(kept, set(FacetCount.objects.values_list(*columns)))
+
+    def test_deltas_match_a_full_recount(self):
+        student = make_student(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            books = [make_book(n, language=('en', 'es')[n % 2], year=str(1990 + 5 * n),
+                               publisher=f"Publisher {n % 3}", quantity=n % 3) for n in range(6)]
+        self.assertMatchesRecount()
+
+        book = books[1]
+        book.language, book.year, book.publisher = 'en', '2024', "Publisher 9"
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        self.assertMatchesRecount()
+
+        # the last copy goes out and comes back, through save() and borrow()
+        for quantity in (0, 2):
+            book.quantity = quantity
+            with self.captureOnCommitCallbacks(execute=True):
+                book.save()
+            self.assertMatchesRecount()
+        with self.captureOnCommitCallbacks(execute=True):
+            books[4].borrow(student)
+        self.assertMatchesRecount()
+        with self.captureOnCommitCallbacks(execute=True):
+            circulation.bulk_return(student, [books[4].pk])
+            circulation.bulk_checkout(student, [books[2].pk, books[5].pk])
+        self.assertMatchesRecount()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            books[0].delete()
+            books[3].delete()
+        self.assertMatchesRecount()
+
+
+@override_settings(BACKGROUND_TASKS='off')
+class BookCardTests(TestCase):
+    def card(self, book):
+        return cards.render_cards([Book.objects.get(pk=book.pk)])[0]
+
+    def test_edit_borrow_and_return_in_another_process_replace_the_card(self):
+        book = make_book(quantity=1)
+        student = make_student(0)
+        self.assertIn("<strong>Available:</strong> 1", self.card(book))
+        misses = cards.stats()['misses']
+        self.card(book)
+        self.assertEqual(cards.stats()['misses'], misses)  # served from the cache
+
+        def elsewhere(write):
+            with override_settings(CACHES=OTHER_PROCESS), self.captureOnCommitCallbacks(execute=True):
+                write()
+
+        book.publisher = "Other Publisher"
+        elsewhere(book.save)
+        self.assertIn("Other Publisher", self.card(book))
+        elsewhere(lambda: book.borrow(student))
+        self.assertIn("<strong>Available:</strong> 0", self.card(book))
+        elsewhere(lambda: circulation.bulk_return(student, [book.pk]))
+        self.assertIn("<strong>Available:</strong> 1", self.card(book))
+
+
+class CoverVariantTests(TestCase):
+    def test_small_cover_gets_each_size_in_jpeg_and_webp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        os.makedirs(os.path.join(media_root, 'covers'))
+        # transparent PNG: the JPEG copies have to be flattened
+        Image.new('RGBA', (600, 900), (200, 30, 30, 128)).save(os.path.join(media_root, 'covers', 'small.png'))
+
+        variants = covers.build_variants(media_root, 'covers/small.png')
+        self.assertEqual(variants['source'], 'covers/small.png')
+        expected = {'thumb': (240, 360), 'medium': (480, 720)}
+        for size, dimensions in expected.items():
+            self.assertEqual((variants[size]['width'], variants[size]['height']), dimensions)
+            for fmt, mode in (('jpeg', 'RGB'), ('webp', 'RGBA')):
+                name = variants[size][fmt]
+                self.assertIn(variants['hash'], name)
+                with Image.open(os.path.join(media_root, name)) as image:
+                    self.assertEqual((image.format.lower(), image.size, image.mode), (fmt, dimensions, mode))
+        # same source, same files
+        self.assertEqual(covers.build_variants(media_root, 'covers/small.png'), variants)
+
+        # never scaled up past the original
+        Image.new('RGB', (100, 150)).save(os.path.join(media_root, 'covers', 'tiny.png'))
+        tiny = covers.build_variants(media_root, 'covers/tiny.png')
+        self.assertEqual({size: (tiny[size]['width'], tiny[size]['height']) for size in expected},
+                         {'thumb': (100, 150), 'medium': (100, 150)})
+
+    def test_backfill_changes_the_book_and_catalog_etags(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        os.makedirs(os.path.join(media_root, 'covers'))
+        Image.new('RGB', (600, 900)).save(os.path.join(media_root, 'covers', 'old.png'))
+        book = make_book()
+        # an upload from before variants existed (no post_save)
+        Book.objects.filter(pk=book.pk).update(cover='covers/old.png')
+        before, catalog = Book.objects.get(pk=book.pk).updated_at, CatalogState.current().version
+
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command('build_cover_variants', workers=1, stdout=io.StringIO())
+        book.refresh_from_db()
+        self.assertEqual(book.cover_variants['source'], 'covers/old.png')
+        self.assertGreater(book.updated_at, before)
+        self.assertGreater(CatalogState.current().version, catalog)
+
+
+class OverdueSweepTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        book = make_book(quantity=20)
+        for n in range(12):
+            borrowed = cls.now - datetime.timedelta(days=30)
+            # every third loan is not due yet
+            due = borrowed + datetime.timedelta(days=60 if n % 3 == 2 else 15)
+            Borrow.objects.create(student=make_student(n), book=book, borrowed_at=borrowed, returned_due_date=due)
+        cls.overdue = list(Borrow.objects.overdue(now=cls.now).order_by('pk').values_list('pk', flat=True))
+
+    def test_interrupted_sweep_resumes_after_its_checkpoint(self):
+        class Interrupted(Exception):
+            pass
+
+        def stop_after_first_chunk(checkpoint):
+            raise Interrupted
+
+        with self.assertRaises(Interrupted):
+            notices.sweep(self.now, chunk_size=3, progress=stop_after_first_chunk)
+        checkpoint = JobCheckpoint.objects.get(name=notices.SWEEP_JOB)
+        self.assertEqual((checkpoint.last_id, checkpoint.processed, checkpoint.finished), (self.overdue[2], 3, False))
+        self.assertEqual(OverdueNotice.objects.count(), 3)
+
+        chunks = []
+        checkpoint = notices.sweep(self.now, chunk_size=3, progress=lambda c: chunks.append(c.last_id))
+        # the remaining five of the eight overdue loans, nothing read twice
+        self.assertEqual(chunks, [self.overdue[5], self.overdue[7]])
+        self.assertEqual((checkpoint.processed, checkpoint.finished), (len(self.overdue), True))
+        self.assertEqual(sorted(OverdueNotice.objects.values_list('borrow_id', flat=True)), self.overdue)
+
+    def test_rerun_sends_no_duplicate_notices(self):
+        notices.sweep(self.now, chunk_size=3)
+        self.assertEqual(notices.deliver(), len(self.overdue))
+        notices.sweep(self.now, chunk_size=3)
+        notices.sweep(self.now, chunk_size=3, restart=True)
+        self.assertEqual(notices.deliver(), 0)
+        self.assertEqual(OverdueNotice.objects.count(), len(self.overdue))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         sorted(Borrow.objects.filter(pk__in=self.overdue).values_list('student__email', flat=True)))
+
+
+@override_settings(BACKGROUND_TASKS='off')
+class FullTextSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.by_title = make_book(1, title="Gardening Basics", author="Ann Lee", publisher="Green")
+        cls.by_author = make_book(2, title="Soil", author="Sam Gardening", publisher="Green")
+        cls.by_publisher = make_book(3, title="Roses", author="Ann Lee", publisher="Gardening Press")
+        cls.unrelated = make_book(4, title="Compilers", author="Al Aho", publisher="Addison")
+
+    def ids(self, query):
+        return search.ranked_ids(query, limit=10)
+
+    def test_title_beats_author_beats_publisher(self):
+        self.assertEqual(self.ids("gardening"), [self.by_title.pk, self.by_author.pk, self.by_publisher.pk])
+        # prefixes and stems match; every term has to
+        self.assertEqual(self.ids("garden"), self.ids("gardening"))
+        self.assertEqual(self.ids("gardening basics"), [self.by_title.pk])
+        self.assertEqual(self.ids("ann roses"), [self.by_publisher.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.by_title.title = "Orchids"
+        self.by_title.save()
+        self.assertEqual(self.ids("gardening basics"), [])
+        self.assertEqual(self.ids("orchids"), [self.by_title.pk])
+
+        Book.objects.filter(pk=self.unrelated.pk).update(author="Grace Hopper")
+        self.assertEqual(self.ids("aho"), [])
+        self.assertEqual(self.ids("hopper"), [self.unrelated.pk])
+
+        self.by_author.delete()
+        self.assertEqual(self.ids("gardening"), [self.by_publisher.pk])
+
+    def test_view_handles_empty_odd_and_isbn_queries(self):
+        url = reverse('book_search')
+        for query in ("", "   ", "*", '"', "AND OR NOT", "NEAR(a b)", "title:x", "'); DROP TABLE main_book; --"):
+            response = self.client.get(url, {'q': query})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context['books']), [])
+        response = self.client.get(url, {'q': "Gardening!", 'page': 'x'})
+        self.assertEqual([b.pk for b in response.context['books']][:1], [self.by_title.pk])
+        response = self.client.get(url, {'q': self.unrelated.isbn})
+        self.assertEqual([b.pk for b in response.context['books']], [self.unrelated.pk])
+
+        with override_settings(CATALOG_PAGE_SIZE=2):
+            first = self.client.get(url, {'q': "gardening"}).context
+            second = self.client.get(url, {'q': "gardening", 'page': 2}).context
+        self.assertTrue(first['has_next'])
+        self.assertEqual([b.pk for b in first['books'] + second['books']],
+                         [self.by_title.pk, self.by_author.pk, self.by_publisher.pk])
+        self.assertFalse(second['has_next'])
+
+
+@override_settings(BACKGROUND_TASKS='off')
+class ConcurrentBorrowTests(TransactionTestCase):
+    COPIES = 5
+    STUDENTS = 24
+
+    def test_last_copies_are_never_oversubscribed(self):
+        book = make_book(quantity=self.COPIES)
+        students = [make_student(n) for n in range(self.STUDENTS)]
+        errors, start = [], threading.Barrier(self.STUDENTS)
+
+        def attempt(student):
+            start.wait()
+            try:
+                while True:
+                    try:
+                        Book.objects.get(pk=book.pk).borrow(student)
+                        return
+                    except OperationalError:
+                        # SQLite answers write contention with "database is
+                        # locked" instead of waiting; PostgreSQL never gets here
+                        time.sleep(0.001)
+            except ValidationError:
+                pass  # no copy left (or, after a SQLite retry, already ours)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=attempt, args=(s,)) for s in students]
+        began = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - began
+
+        book.refresh_from_db()
+        loans = Borrow.objects.filter(book=book)
+        self.assertEqual(errors, [])
+        self.assertEqual(book.quantity, 0)
+        self.assertEqual(loans.count(), self.COPIES)
+        self.assertEqual(loans.values('student').distinct().count(), self.COPIES)
+        print(f"\n{self.STUDENTS} concurrent borrow attempts in {elapsed:.3f}s "
+              f"({self.STUDENTS / elapsed:.0f} attempts/s)")
+
+    def test_second_open_loan_is_rejected(self):
+        book = make_book(quantity=2)
+        student = make_student(0)
+        book.borrow(student)
+        with self.assertRaises(AlreadyBorrowed):
+            book.borrow(student)
+        book.refresh_from_db()
+        self.assertEqual(book.quantity, 1)
+
+
+@override_settings(BACKGROUND_TASKS='sync')
+class ReservationQueueTests(TestCase):
+    def test_book_page_borrow_waits_its_turn(self):
+        book = make_book(quantity=0)
+        first, second, walk_in = (make_student(n) for n in range(3))
+        for student in (first, second):
+            Reservation.objects.create(student=student, book=book)
+        # a copy is back on the shelf but not promoted yet
+        Book.objects.filter(pk=book.pk).update(quantity=1)
+
+        def borrow(student):
+            self.client.force_login(student.user)
+            self.client.post(reverse('borrow', args=[book.pk]))
+            return Borrow.objects.filter(student=student, book=book).exists()
+
+        self.assertFalse(borrow(walk_in))
+        self.assertFalse(borrow(second))
+        self.assertTrue(borrow(first))
+        self.assertEqual(list(Reservation.objects.values_list('student', flat=True)), [second.pk])
+        self.assertEqual(Book.objects.get(pk=book.pk).quantity, 0)
+
+    def test_desk_checkout_waits_its_turn(self):
+        held, spare = make_book(1, quantity=1), make_book(2, quantity=2)
+        first, second, walk_in = (make_student(n) for n in range(3))
+        for student, book in ((first, held), (second, held), (second, spare)):
+            Reservation.objects.create(student=student, book=book)
+
+        def checkout(student, books):
+            return [r['ok'] for r in circulation.bulk_checkout(student, [b.pk for b in books])]
+
+        self.assertEqual(checkout(walk_in, [held, spare]), [False, False])
+        self.assertEqual(circulation._checkout_one(walk_in, held.pk)['ok'], False)
+        self.assertEqual(checkout(second, [held, spare]), [False, True])
+        self.assertEqual(checkout(first, [held]), [True])
+        self.assertEqual(list(Reservation.objects.values_list('student', 'book')), [(second.pk, held.pk)])
+        self.assertEqual([b.quantity for b in Book.objects.filter(pk__in=[held.pk, spare.pk]).order_by('pk')], [0, 1])
+
+    def test_returns_promote_in_queue_order(self):
+        book = make_book(quantity=2)
+        holders = [make_student(n) for n in range(2)]
+        for student in holders:
+            book.borrow(student)
+        queue = [make_student(n) for n in range(2, 5)]
+        for student in queue:
+            Reservation.objects.create(student=student, book=book)
+
+        for holder, expected in zip(holders, queue):
+            with self.captureOnCommitCallbacks(execute=True):
+                circulation.bulk_return(holder, [book.pk])
+            self.assertTrue(Borrow.objects.open().filter(student=expected, book=book).exists())
+        self.assertEqual(list(Reservation.objects.values_list('student', flat=True)), [queue[2].pk])
+        self.assertEqual(Book.objects.get(pk=book.pk).quantity, 0)
+
+
+@override_settings(BACKGROUND_TASKS='off')
+class ConcurrentPromotionTests(TransactionTestCase):
+    HOLDERS = 4
+    WAITING = 10
+
+    def test_concurrent_returns_promote_each_student_once(self):
+        book = make_book(quantity=self.HOLDERS)
+        holders = [make_student(n) for n in range(self.HOLDERS)]
+        for student in holders:
+            book.borrow(student)
+        queue = [make_student(n) for n in range(self.HOLDERS, self.HOLDERS + self.WAITING)]
+        for student in queue:
+            Reservation.objects.create(student=student, book=book)
+        errors, start = [], threading.Barrier(self.HOLDERS)
+
+        def retrying(func, *args):
+            while True:
+                try:
+                    return func(*args)
+                except OperationalError:
+                    time.sleep(0.001)  # SQLite "database is locked"
+
+        def return_and_promote(student):
+            start.wait()
+            try:
+                retrying(circulation.bulk_return, student, [book.pk])
+                retrying(reservations.promote, book.pk)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=return_and_promote, args=(s,)) for s in holders]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # a worker that lost the race for a copy leaves its claim for the sweep
+        reservations.promote_all()
+
+        self.assertEqual(errors, [])
+        promoted = list(Borrow.objects.open().filter(book=book).values_list('student', flat=True))
+        waiting = list(Reservation.objects.values_list('student', flat=True))
+        self.assertEqual(len(promoted), self.HOLDERS)
+        self.assertEqual(len(set(promoted)), self.HOLDERS)
+        self.assertEqual(sorted(promoted + waiting), sorted(s.pk for s in queue))
+        self.assertEqual(Book.objects.get(pk=book.pk).quantity, 0)
+
+
+class BulkCirculationTests(TestCase):
+    ITEMS = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_student(0)
+        cls.other = make_student(1)
+        cls.books = [make_book(n, quantity=2) for n in range(cls.ITEMS)]
+
+    def test_results_per_item(self):
+        self.books[1].borrow(self.student)
+        Book.objects.filter(pk=self.books[2].pk).update(quantity=0)
+        scans = [self.books[0].isbn, str(self.books[1].pk), str(self.books[2].pk), 'nope']
+        results = circulation.bulk_checkout(self.student, scans)
+        self.assertEqual([r['ok'] for r in results], [True, False, False, False])
+
+        results = circulation.bulk_return(self.student, [str(self.books[0].pk), self.books[3].isbn])
+        self.assertEqual([r['ok'] for r in results], [True, False])
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).quantity, 2)
+
+    def test_returning_twice_restocks_once(self):
+        books = self.books[:3]
+        circulation.bulk_checkout(self.student, [b.pk for b in books])
+        scans = [str(b.pk) for b in books] + [str(books[0].pk)]
+        first = circulation.bulk_return(self.student, scans)
+        again = circulation.bulk_return(self.student, scans)
+        self.assertEqual([r['ok'] for r in first], [True, True, True, False])
+        self.assertEqual([r['ok'] for r in again], [False] * 4)
+        self.assertEqual([b.quantity for b in Book.objects.filter(pk__in=[b.pk for b in books])], [2, 2, 2])
+
+    def test_return_racing_another_return_restocks_once(self):
+        book = self.books[0]
+        circulation.bulk_checkout(self.student, [book.pk])
+        loan = Borrow.objects.get(student=self.student, book=book, returned_at__isnull=True)
+
+        def other_desk_first(execute, sql, params, many, context):
+            # another desk closes the loan between our read and our UPDATE
+            if sql.startswith('UPDATE "main_borrow"') and not raced:
+                raced.append(True)
+                Borrow.objects.filter(pk=loan.pk).update(returned_at=timezone.now())
+                Book.objects.filter(pk=book.pk).update(quantity=F('quantity') + 1)
+            return execute(sql, params, many, context)
+
+        raced = []
+        with connection.execute_wrapper(other_desk_first):
+            results = circulation.bulk_return(self.student, [book.pk])
+        self.assertTrue(raced)
+        self.assertEqual([r['ok'] for r in results], [False])
+        self.assertEqual(Book.objects.get(pk=book.pk).quantity, 2)
+
+    def test_return_view_racing_a_desk_return_restocks_once(self):
+        book = self.books[0]
+        book.borrow(self.student)
+        loan = Borrow.objects.get(student=self.student, book=book, returned_at__isnull=True)
+
+        def desk_first(execute, sql, params, many, context):
+            # the desk closes the loan after the form found it open
+            if sql.startswith('UPDATE "main_borrow"') and not raced:
+                raced.append(True)
+                circulation.bulk_return(self.student, [book.pk])
+            return execute(sql, params, many, context)
+
+        raced = []
+        self.client.force_login(self.student.user)
+        with connection.execute_wrapper(desk_first):
+            response = self.client.post(reverse('return', args=[book.pk]), {'confirm': 'on'})
+        self.assertTrue(raced)
+        self.assertEqual([str(m) for m in get_messages(response.wsgi_request)],
+                         [f"'{book.title}' has already been returned."])
+        self.assertEqual(Book.objects.get(pk=book.pk).quantity, 2)
+        self.assertIsNotNone(Borrow.objects.get(pk=loan.pk).returned_at)
+
+    def test_bulk_beats_single_calls(self):
+        def run(label, func):
+            with CaptureQueriesContext(connection) as queries:
+                began = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - began
+            print(f"\n{label}: {self.ITEMS} items, {len(queries)} queries, {elapsed * 1000:.1f} ms")
+            return len(queries)
+
+        single = run("single borrow() calls", lambda: [b.borrow(self.other) for b in self.books])
+        bulk = run("bulk_checkout", lambda: circulation.bulk_checkout(self.student, [b.isbn for b in self.books]))
+
+        self.assertEqual(Borrow.objects.filter(student=self.student).count(), self.ITEMS)
+        self.assertLess(bulk, 10)
+        self.assertLess(bulk * 10, single)
+
+
+class MetadataFetchTests(TestCase):
+    ISBNS = [isbn_for(n) for n in range(20)]
+
+    def test_lookups_run_concurrently_up_to_the_worker_limit(self):
+        for workers in (1, 4, 10):
+            lock, in_flight, peak = threading.Lock(), [0], [0]
+            # each round of lookups only returns once `workers` are in flight
+            together = threading.Barrier(workers, timeout=5)
+
+            def provider(isbn):
+                with lock:
+                    in_flight[0] += 1
+                    peak[0] = max(peak[0], in_flight[0])
+                try:
+                    together.wait()
+                    return {'Title': f"Title {isbn}"}
+                finally:
+                    with lock:
+                        in_flight[0] -= 1
+
+            results = list(metadata.fetch_many(self.ISBNS, provider, workers=workers, retries=0, use_cache=False))
+            self.assertEqual([(isbn, error) for isbn, _, error in results], [(isbn, None) for isbn in self.ISBNS])
+            self.assertEqual(peak[0], workers)
+
+    def test_failed_lookups_are_retried(self):
+        calls = []
+
+        def flaky(isbn):
+            calls.append(isbn)
+            if len(calls) < 3:
+                raise OSError("connection reset")
+            return {'Title': "Recovered"}
+
+        [(isbn, meta, error)] = metadata.fetch_many(["9780000000001"], flaky, retries=2, backoff=0, use_cache=False)
+        self.assertEqual((meta, error, len(calls)), ({'Title': "Recovered"}, None, 3))
+
+    def test_cache_serves_repeat_lookups(self):
+        calls = []
+
+        def counting(isbn):
+            calls.append(isbn)
+            return {} if isbn == "9781492056355" else {'Title': isbn}
+
+        metadata.clear_memory()
+        # ISBN-10 and hyphenated forms share the ISBN-13 entry
+        for isbn in ("9780262033848", "0262033844", "978-0-262-03384-8", "9781492056355", "9781492056355"):
+            metadata.lookup(isbn, counting)
+        self.assertEqual(calls, ["9780262033848", "9781492056355"])
+
+        metadata.clear_memory()  # a fresh process still finds the table rows
+        self.assertEqual(metadata.lookup("9780262033848", counting), {'Title': "9780262033848"})
+        self.assertEqual(len(calls), 2)
+
+        # past the negative TTL, "no metadata" is asked again
+        IsbnMetadata.objects.update(fetched_at=timezone.now() - datetime.timedelta(days=2))
+        metadata.clear_memory()
+        metadata.lookup("9780262033848", counting)
+        metadata.lookup("9781492056355", counting)
+        self.assertEqual(calls[2:], ["9781492056355"])
+
+    def test_import_books_writes_every_book(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write("\n".join(self.ISBNS))
+        self.addCleanup(os.unlink, f.name)
+        call_command('import_books', file=f.name, workers=10, provider='main.tests.fake_provider', stdout=io.StringIO())
+        self.assertEqual(Book.objects.filter(isbn__in=self.ISBNS).count(), len(self.ISBNS))
+        # bulk inserts skip post_save, so the importer keeps facets itself
+        self.assertEqual(FacetCount.objects.get(facet='publisher', value="Press").total, len(self.ISBNS))
+
+
+
+@override_settings(BACKGROUND_TASKS='off')
+class ImportBooksTests(TestCase):
+    ISBNS = [isbn_for(n) for n in range(5)]
+
+    def import_books(self, lines, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write("\n".join(lines))
+        self.addCleanup(os.unlink, f.name)
+        provider_calls.clear()
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_books', file=f.name, provider='main.tests.recording_provider', stdout=out, **options)
+        return out.getvalue()
+
+    def assertFacetsMatchRecount(self):
+        columns = ('facet', 'value', 'total', 'available')
+        kept = set(FacetCount.objects.values_list(*columns))
+        facets.rebuild()
+        self.assertEqual(kept, set(FacetCount.objects.values_list(*columns)))
+
+    def test_books_already_present_cost_one_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(len(self.ISBNS)):
+                make_book(n)
+        with self.assertNumQueries(1):
+            out = self.import_books(self.ISBNS)
+        self.assertEqual(provider_calls, [])
+        self.assertIn("0 added, 0 updated, 5 skipped", out)
+
+    def test_update_refreshes_existing_books_in_bulk(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(len(self.ISBNS)):
+                make_book(n, title="Old title", language=('en', 'es')[n % 2])
+        with CaptureQueriesContext(connection) as queries:
+            out = self.import_books(self.ISBNS, update=True)
+        self.assertIn("0 added, 5 updated", out)
+        # one CASE WHEN update for the batch rather than a save() per book
+        self.assertEqual(sum('CASE WHEN' in q['sql'] for q in queries.captured_queries), 1)
+        self.assertEqual(
+            set(Book.objects.values_list('isbn13', 'title', 'publisher', 'language')),
+            {(isbn, f"Title {isbn}", "Press", 'en') for isbn in self.ISBNS},
+        )
+        self.assertEqual(Book.objects.count(), len(self.ISBNS))
+        self.assertFacetsMatchRecount()
+
+        # a second run finds nothing to change
+        self.assertIn("0 added, 0 updated", self.import_books(self.ISBNS, update=True))
+
+    def test_duplicates_in_one_file_are_collapsed(self):
+        isbn = "9780262033848"
+        self.import_books([isbn, "0262033844", "978-0-262-03384-8", isbn, self.ISBNS[0]])
+        self.assertEqual(sorted(provider_calls), sorted([isbn, self.ISBNS[0]]))
+        self.assertEqual(sorted(Book.objects.values_list('isbn13', flat=True)), sorted([isbn, self.ISBNS[0]]))
+        self.assertFacetsMatchRecount()
+
+class DumpProviderTests(TestCase):
+    def write_dump(self, name, text):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_jsonl_and_csv_dumps(self):
+        jsonl = self.write_dump('dump.jsonl', "\n".join([
+            '{"isbn": "0262033844", "title": "Old title", "authors": ["T. Cormen"], "publisher": "MIT", "year": 2009}',
+            '{"ISBN-13": "9780131103627", "Title": "The C Programming Language", "Authors": "B. Kernighan; D. Ritchie", "Publisher": "PH", "Year": "1988"}',
+            '{"isbn": "978-0-262-03384-8", "title": "Introduction to Algorithms", "authors": ["T. Cormen"], "publisher": "MIT", "year": 2009}',
+        ]) + "\n")
+        self.assertEqual(dumps.build_index(jsonl), 3)
+        provider = dumps.DumpProvider(jsonl)
+        self.assertEqual(len(provider), 3)
+        self.assertEqual(provider("9780262033848")['Title'], "Introduction to Algorithms")  # last record wins
+        self.assertEqual(provider("0131103628")['Authors'], ["B. Kernighan", "D. Ritchie"])
+        self.assertEqual(provider("9781492056355"), {})
+
+        csv_dump = self.write_dump('dump.csv', 'isbn,title,authors,publisher,year,language\n'
+                                               '9780131103627,"C, Second Edition",B. Kernighan,PH,1988,EN\n')
+        self.assertEqual(dumps.build_index(csv_dump), 1)
+        self.assertEqual(dumps.DumpProvider(csv_dump)("9780131103627")['Title'], "C, Second Edition")
+
+    def test_import_books_from_dump(self):
+        path = self.write_dump('dump.jsonl', '{"isbn": "9780131103627", "title": "K&R", "authors": ["B. Kernighan"], '
+                                             '"publisher": "PH", "year": 1988, "language": "en"}\n')
+        isbns = self.write_dump('isbns.txt', "9780131103627\n9781492056355\n")
+        with override_settings(METADATA_DUMP=path):
+            call_command('import_books', file=isbns, provider='main.dumps.provider', stdout=io.StringIO())
+        self.assertEqual(list(Book.objects.values_list('isbn', 'title')), [("9780131103627", "K&R")])
+        self.assertFalse(IsbnMetadata.objects.exists())  # dump lookups bypass the cache
+
+
+@override_settings(METADATA_PROVIDER='main.tests.recording_provider', BACKGROUND_TASKS='sync')
+class MetadataVerificationTests(TestCase):
+    ISBN = "9780131103627"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_librarian()
+
+    def setUp(self):
+        metadata.clear_memory()
+        self.client.force_login(self.librarian)
+
+    def add(self, **fields):
+        data = dict(
+            title=f"Title {self.ISBN}", author="A. Writer", isbn=self.ISBN,
+            publisher="Press", year="2001", language='en', quantity=1,
+        )
+        data.update(fields)
+        provider_calls.clear()
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('new_book'), data)
+        self.assertRedirects(response, reverse('books'), fetch_redirect_response=False)
+        # the submit never waits for the (slow) metadata provider
+        self.assertEqual(provider_calls, [])
+        book = Book.objects.get(isbn=self.ISBN)
+        self.assertEqual(book.metadata_status, 'pending')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(provider_calls, [self.ISBN])
+        book.refresh_from_db()
+        return book
+
+    def test_matching_book_is_verified(self):
+        self.assertEqual(self.add().metadata_status, 'verified')
+
+    def test_mismatch_goes_to_review_queue(self):
+        book = self.add(publisher="Someone Else")
+        self.assertEqual(book.metadata_status, 'mismatch')
+        self.assertEqual(len(book.metadata_problems), 1)
+        self.assertContains(self.client.get(reverse('librarian_metadata_review')), "Someone Else")
+
+        # fixing the details sends the book through verification again
+        book.publisher = "Press"
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        book.refresh_from_db()
+        self.assertEqual((book.metadata_status, book.metadata_problems), ('verified', []))
+
+    def test_failed_lookup_stays_pending(self):
+        book = make_book(isbn=self.ISBN)
+        with override_settings(METADATA_PROVIDER='main.tests.broken_provider'):
+            self.assertIsNone(verification.verify(book.pk))
+            self.assertEqual(verification.verify_pending(), 0)
+        self.assertEqual(verification.verify_pending(), 1)
+
+
+class IsbnLookupTests(TestCase):
+    ISBN10, ISBN13 = "0-262-03384-4", "9780262033848"
+
+    def test_every_spelling_finds_the_book(self):
+        book = make_book(isbn=self.ISBN13)
+        for spelling in (self.ISBN10, "0262033844", "978-0-262-03384-8", self.ISBN13):
+            with self.assertNumQueries(1):
+                self.assertEqual(Book.objects.by_isbn(spelling).get(), book)
+            self.assertEqual(circulation._resolve([spelling]), [book])
+
+        duplicate = Book(title="Copy", author="A", isbn=self.ISBN10, publisher="P", year="2009", language='en')
+        with self.assertRaises(ValidationError):
+            duplicate.full_clean()
+
+
+class StudentDirectoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.students = [make_student(n) for n in range(12)]
+        book = make_book()
+        now = timezone.now()
+        Borrow.objects.create(student=cls.students[1], book=book, borrowed_at=now, returned_due_date=now + datetime.timedelta(days=1))
+        Borrow.objects.create(student=cls.students[2], book=book, borrowed_at=now, returned_due_date=now - datetime.timedelta(days=3))
+        # returned, but four days late: still owes the fee
+        Borrow.objects.create(student=cls.students[3], book=book, borrowed_at=now - datetime.timedelta(days=20),
+                              returned_due_date=now - datetime.timedelta(days=5), returned_at=now - datetime.timedelta(days=1))
+        # returned on time
+        Borrow.objects.create(student=cls.students[4], book=book, borrowed_at=now - datetime.timedelta(days=20),
+                              returned_due_date=now - datetime.timedelta(days=5), returned_at=now - datetime.timedelta(days=6))
+
+    def found(self, query='', **flags):
+        students = directory.search(directory.with_loan_flags(Student.objects.all()), query)
+        return sorted(s.student_id - 1000 for s in students.filter(**flags))
+
+    def test_prefix_search_and_flags(self):
+        self.assertEqual(self.found("last1"), [1, 10, 11])
+        self.assertEqual(self.found("FIRST1 last11"), [11])
+        self.assertEqual(self.found("101"), [10, 11])  # student IDs 1010 and 1011
+        self.assertEqual(self.found("student2@"), [2])
+        self.assertEqual(self.found(has_loans=True), [1, 2])
+        self.assertEqual(self.found(has_fees=True), [2, 3])
+
+    def test_fee_flag_agrees_with_dashboard_total(self):
+        for student in directory.with_loan_flags(Student.objects.all()):
+            self.assertEqual(student.has_fees, dashboard.compute(student.pk)['total_fees'] > 0)
+
+
+@override_settings(BACKGROUND_TASKS='off')
+class StudentDashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student, cls.other = make_student(1), make_student(2)
+        cls.books = [make_book(n) for n in range(6)]
+        now = timezone.now()
+        for n in range(40):
+            borrowed = now - datetime.timedelta(days=400 - n)
+            Borrow.objects.create(
+                student=cls.student, book=cls.books[n % 3], borrowed_at=borrowed,
+                returned_due_date=borrowed + datetime.timedelta(days=15),
+                returned_at=borrowed + datetime.timedelta(days=16 + n % 2),
+            )
+        Borrow.objects.create(student=cls.student, book=cls.books[3], borrowed_at=now,
+                              returned_due_date=now + datetime.timedelta(days=1))
+        Borrow.objects.create(student=cls.student, book=cls.books[4], borrowed_at=now,
+                              returned_due_date=now - datetime.timedelta(days=2))
+        Reservation.objects.create(student=cls.other, book=cls.books[5])
+        Reservation.objects.create(student=cls.student, book=cls.books[5])
+
+    def setUp(self):
+        self.client.force_login(self.student.user)
+        self.client.get(reverse('books'))
+
+    def dashboard_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('student_dashboard'))
+        return response, len(queries)
+
+    def test_summary_matches_loans(self):
+        summary = dashboard.compute(self.student.pk)
+        self.assertEqual([loan['book_id'] for loan in summary['active']], [self.books[4].pk, self.books[3].pk])
+        self.assertEqual((summary['due_soon'], summary['overdue'], summary['borrowed']), (1, 1, 42))
+        expected = sum(b.calculate_late_fee() for b in Borrow.objects.filter(student=self.student))
+        self.assertEqual(summary['total_fees'], expected)
+        self.assertEqual([r['position'] for r in summary['reservations']], [2])
+
+    def test_summary_is_cached_until_a_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            dashboard.invalidate(self.student.pk)
+        response, first = self.dashboard_queries()
+        self.assertEqual(len(response.context['history']), settings.STUDENT_HISTORY_PAGE_SIZE)
+        _, cached = self.dashboard_queries()
+        self.assertLess(cached, first)
+
+        # changes made by other processes (a promotion worker, the desk)
+        with override_settings(CACHES=OTHER_PROCESS), self.captureOnCommitCallbacks(execute=True):
+            Reservation.objects.filter(student=self.other).get().delete()
+        response, _ = self.dashboard_queries()
+        self.assertEqual(response.context['summary']['reservations'][0]['position'], 1)
+
+        with override_settings(CACHES=OTHER_PROCESS), self.captureOnCommitCallbacks(execute=True):
+            circulation.bulk_return(self.student, [self.books[3].pk])
+        response, _ = self.dashboard_queries()
+        self.assertEqual(len(response.context['summary']['active']), 1)
+
+
+class RosterImportTests(TestCase):
+    def test_import_creates_accounts_and_reports_bad_rows(self):
+        make_student(1)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        roster, errors = os.path.join(directory, "roster.csv"), os.path.join(directory, "errors.csv")
+        with open(roster, "w") as f:
+            f.write(
+                "email,first_name,middle_initial,last_name,sex,id,year,password\n"
+                "new1@students.kennesaw.edu,Ann,B,Lee,F,2001,SO,s3cret-pass\n"
+                "new2@students.kennesaw.edu,Bob,,Ray,m,2002,,\n"
+                "boss@staff.kennesaw.edu,Cat,,Kim,F,77,,\n"
+                "someone@example.com,Dan,,Fox,M,2003,FR,\n"
+                "again@students.kennesaw.edu,Eve,,Ng,F,1001,FR,\n"
+                "new3@students.kennesaw.edu,Fay,,Oh,F,2001,JR,\n"
+                "big@students.kennesaw.edu,Gil,,Wu,M,2147483648,FR,\n"
+                "max@students.kennesaw.edu,Hal,,Xu,M,2147483647,FR,\n"
+            )
+        call_command("import_roster", file=roster, errors=errors, workers=1, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(sorted(Student.objects.filter(student_id__gte=2000).values_list("student_id", flat=True)), [2001, 2002, 2147483647])
+        self.assertTrue(Librarian.objects.filter(staff_id=77, user__groups__name='Librarian').exists())
+        self.assertEqual(User.objects.filter(groups__name='Student', student_profile__student_id__gte=2000).count(), 3)
+        self.assertTrue(User.objects.get(username="new1@students.kennesaw.edu").check_password("s3cret-pass"))
+        self.assertFalse(User.objects.get(username="new2@students.kennesaw.edu").has_usable_password())
+        with open(errors) as f:
+            self.assertEqual([row["email"] for row in csv.DictReader(f)], [
+                "someone@example.com", "again@students.kennesaw.edu", "new3@students.kennesaw.edu",
+                "big@students.kennesaw.edu",
+            ])
+
+
+class RecommendationTests(TestCase):
+    def test_cooccurrence_neighbours(self):
+        # books 1 and 2 always go together; 3 only once with 1
+        students = np.array([1, 1, 2, 2, 3, 3, 3, 4])
+        books = np.array([1, 2, 1, 2, 1, 2, 3, 3])
+        book, rank, neighbour, score = recommendations.build(students, books, top_k=5, min_support=1)
+        found = {(int(b), int(n)): s for b, n, s in zip(book, neighbour, score)}
+        self.assertAlmostEqual(found[1, 2], 1.0)
+        self.assertAlmostEqual(found[1, 3], 1 / np.sqrt(3 * 2))
+        self.assertEqual([int(n) for b, n in zip(book, neighbour) if b == 1], [2, 3])
+        self.assertEqual([int(r) for b, r in zip(book, rank) if b == 1], [0, 1])
+
+        book, _, neighbour, _ = recommendations.build(students, books, top_k=5, min_support=2)
+        self.assertEqual(sorted(zip(book.tolist(), neighbour.tolist())), [(1, 2), (2, 1)])
+
+    def test_pages_serve_stored_neighbours(self):
+        books = [make_book(n) for n in range(4)]
+        students = [make_student(n) for n in range(3)]
+        now = timezone.now()
+        for student in students:
+            for n, book in enumerate(books[:2] if student is not students[2] else books[:3]):
+                Borrow.objects.create(student=student, book=book, borrowed_at=now - datetime.timedelta(days=n),
+                                      returned_due_date=now, returned_at=now)
+        self.client.force_login(students[0].user)
+        book_url = reverse('book', args=[books[0].pk])
+        etag = self.client.get(book_url)['ETag']
+        self.assertEqual(self.client.get(reverse('student_dashboard')).context['summary']['recommendations'], [])
+
+        # the nightly rebuild runs in a process of its own
+        with override_settings(CACHES=OTHER_PROCESS):
+            call_command("build_recommendations", min_support=1, stdout=io.StringIO())
+        self.assertEqual(self.client.get(book_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        summary = self.client.get(reverse('student_dashboard')).context['summary']
+        self.assertEqual([r['recommended_id'] for r in summary['recommendations']], [books[2].pk])
+
+        with self.assertNumQueries(1):
+            self.assertEqual([r['recommended_id'] for r in recommendations.for_book(books[0].pk)],
+                             [books[1].pk, books[2].pk])
+        self.assertEqual([r['recommended_id'] for r in recommendations.for_student(students[0].pk)], [books[2].pk])
+        self.assertContains(self.client.get(book_url), books[2].title)
+
+
+@override_settings(BACKGROUND_TASKS='off')
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = make_book(quantity=0)
+        cls.alice, cls.bob = make_student(1), make_student(2)
+
+    def get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def test_unchanged_pages_answer_304_per_viewer(self):
+        url = reverse('book', args=[self.book.pk])
+        self.client.force_login(self.alice.user)
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, etag).status_code, 304)
+        catalog_etag = self.get(reverse('books'))['ETag']
+        self.assertEqual(self.get(reverse('books'), catalog_etag).status_code, 304)
+
+        # another viewer sees different buttons and names, so never Alice's copy
+        self.client.force_login(self.bob.user)
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        self.client.force_login(self.alice.user)
+        self.book.publisher = "Other Publisher"
+        self.book.save()
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_flash_message_after_redirect_is_shown(self):
+        url = reverse('book', args=[self.book.pk])
+        self.client.force_login(self.alice.user)
+        etag = self.get(url)['ETag']
+
+        response = self.client.post(reverse('borrow', args=[self.book.pk]))
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Book cannot be borrowed right now.")
+        # once shown, the page is cacheable again
+        self.assertEqual(self.get(url, etag).status_code, 304)
+
+
+class RoleTests(TestCase):
+    def test_revoked_role_is_denied_in_every_process(self):
+        student = make_student(0)
+        url = reverse('student_dashboard')
+        self.client.force_login(student.user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        # the librarian who revokes the role is served by another process,
+        # whose local cache this one never sees
+        with override_settings(CACHES=OTHER_PROCESS):
+            student.user.groups.clear()
+        response = self.client.get(url)
+        self.assertRedirects(response, f"{reverse('login')}?next={url}", fetch_redirect_response=False)
+
+    def test_deleting_a_user_leaves_no_role_version(self):
+        student = make_student(0)
+        student.user.delete()
+        self.assertFalse(RoleVersion.objects.exists())
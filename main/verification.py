@@ -0,0 +1,69 @@
+import logging
+from django.db import transaction
+from django.utils import timezone
+
+from . import metadata, tasks
+from .isbn import to_isbn13
+from .models import Book
+
+# Background check of a book's details against its ISBN metadata. Adding or
+# editing a book only validates what the database can (see Book.clean) and
+# leaves metadata_status at 'pending'; verify() then does the lookup off the
+# request and records 'verified' or 'mismatch'. Mismatches wait in the
+# librarian review queue. A lookup that fails leaves the book pending for
+# the verify_metadata command to retry.
+
+logger = logging.getLogger(__name__)
+
+CHECKED_FIELDS = ('title', 'author', 'publisher', 'year')
+
+
+def enqueue(book_id):
+    """Verify ``book_id`` once the current transaction commits."""
+    transaction.on_commit(lambda: tasks.submit(verify, book_id))
+
+
+def verify(book_id):
+    """Check one pending book; returns its new status, or None if it stays as it was."""
+    book = Book.objects.filter(pk=book_id, metadata_status='pending').only('isbn', *CHECKED_FIELDS).first()
+    if book is None:
+        return None
+    if not to_isbn13(book.isbn):
+        problems = ["Not a valid ISBN."]
+    else:
+        try:
+            # no in-place retries: verify_metadata sweeps pending books again
+            meta = metadata.lookup(book.isbn, retries=0)
+        except Exception as e:
+            logger.warning("Metadata lookup for book %s failed: %s", book_id, e)
+            return None
+        problems = book.metadata_mismatches(meta)
+
+    status = 'mismatch' if problems else 'verified'
+    # only record the result if nobody edited the book in the meantime
+    unchanged = {name: getattr(book, name) for name in CHECKED_FIELDS}
+    updated = Book.objects.filter(pk=book_id, metadata_status='pending', **unchanged).update(
+        metadata_status=status,
+        metadata_problems=problems,
+        metadata_checked_at=timezone.now(),
+    )
+    return status if updated else None
+
+
+def verify_pending(limit=None):
+    """Verify every pending book (oldest first); returns how many were settled."""
+    ids = Book.objects.filter(metadata_status='pending').order_by('pk').values_list('pk', flat=True)
+    return sum(verify(book_id) is not None for book_id in list(ids[:limit]))
+
+
+def recheck(book_id):
+    """Send a book back through verification (from the review queue)."""
+    Book.objects.filter(pk=book_id).update(metadata_status='pending', metadata_problems=[])
+    enqueue(book_id)
+
+
+def accept(book_id):
+    """A librarian confirmed the book's details as entered."""
+    Book.objects.filter(pk=book_id).update(
+        metadata_status='verified', metadata_problems=[], metadata_checked_at=timezone.now(),
+    )
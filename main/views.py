@@ -4,52 +4,217 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.core.exceptions import ValidationError
 from django.urls import reverse
 
-from .models import Book, Student, Borrow, Reservation, Librarian # Borrow might not be needed directly anymore
-from .forms import BookForm, BorrowForm, ReturnForm, StudentProfileForm, LibrarianProfileForm, AddBookForm, RemoveBookForm, RegistrationForm # BorrowForm might still be needed for student selection,
+from .models import Book, Student, Borrow, Reservation, Librarian, CatalogState, CopyUnavailable # Borrow might not be needed directly anymore
+from .forms import BulkCirculationForm, BookForm, BorrowForm, ReturnForm, StudentProfileForm, LibrarianProfileForm, AddBookForm, RemoveBookForm, RegistrationForm # BorrowForm might still be needed for student selection,
 import datetime
 from django.utils import timezone
 from django.contrib.auth.views import LoginView
 from django.contrib.auth.models import Group
 from django.contrib.auth import get_user_model, login
-from django.contrib.auth.decorators import login_required, user_passes_test
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+import hashlib, json
+from functools import wraps
+
+from .isbn import to_isbn13
+from .pagination import keyset_paginate, page_size_from
+from .roles import get_role, librarian_required, student_required
+from .search import search_books as ranked_search
+from . import analytics, cards, circulation, dashboard, directory, exports, facets, metadata, recommendations, reservations, verification
 
 User = get_user_model()
 
-def is_student(user):
-    return user.groups.filter(name='Student').exists()
-
-def is_librarian(user):
-    return user.groups.filter(name='Librarian').exists()
 # Create your views here.
 def index(request):
     return render(request, "index.html")
+# Conditional GET: both pages also show the viewer's name and role in the
+# navbar (and borrow buttons on the book page), so the viewer is part of the
+# ETag and responses are private to them.
+def _viewer(request):
+    user = request.user
+    if not user.is_authenticated:
+        return 'anonymous'
+    return f"{user.pk}:{user.first_name}:{request.role.name}"
+
+def _etag(*parts):
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()
+
+def _catalog_state(request):
+    # condition() asks for the ETag and Last-Modified separately; one query
+    if not hasattr(request, '_catalog_state'):
+        request._catalog_state = CatalogState.current()
+    return request._catalog_state
+
+def _book_updated_at(request, book_id):
+    if not hasattr(request, '_book_updated_at'):
+        request._book_updated_at = Book.objects.filter(pk=book_id).values_list('updated_at', flat=True).first()
+    return request._book_updated_at
+
+def catalog_etag(request, *args, **kwargs):
+    return _etag(_catalog_state(request).version, request.GET.urlencode(), _viewer(request))
+
+def catalog_last_modified(request, *args, **kwargs):
+    return _catalog_state(request).changed_at
+
+def book_etag(request, book_id):
+    updated_at = _book_updated_at(request, book_id)
+    if updated_at is None:
+        return None
+    # late fees in the history grow by the day without any write, and the
+    # recommendations change with every rebuild
+    return _etag(updated_at.isoformat(), timezone.now().date(), recommendations.version(),
+                 request.GET.urlencode(), _viewer(request))
+
+def book_last_modified(request, book_id):
+    return _book_updated_at(request, book_id)
+
+def conditional_page(etag_func, last_modified_func):
+    """Answer If-None-Match / If-Modified-Since with 304, per viewer."""
+    def decorator(view):
+        conditional = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # A flash message waiting to be shown (e.g. after a failed borrow
+            # redirected here) is not in the ETag, so render the page in full
+            if len(messages.get_messages(request)):
+                return view(request, *args, **kwargs)
+            return conditional(request, *args, **kwargs)
+
+        return vary_on_cookie(cache_control(private=True, no_cache=True)(wrapper))
+    return decorator
+
+# Columns the catalog card actually renders; everything else stays in the DB
+BOOK_CARD_FIELDS = (
+    'id', 'title', 'author', 'isbn', 'publisher',
+    'year', 'language', 'quantity', 'cover', 'cover_variants', 'updated_at',
+)
+
+def catalog_filters(params):
+    """Turn the books page query string into Book filter kwargs."""
+    filters = {}
+    if params.get('language') in dict(Book.LANGUAGE_CHOICES):
+        filters['language'] = params['language']
+    if params.get('publisher'):
+        filters['publisher'] = params['publisher']
+    # year is stored as a 4-digit string, so string comparison orders correctly
+    for param, lookup in (('year_from', 'year__gte'), ('year_to', 'year__lte')):
+        value = params.get(param, '')
+        if len(value) == 4 and value.isdigit():
+            filters[lookup] = value
+    if params.get('available'):
+        filters['quantity__gt'] = 0
+    return filters
+
+@conditional_page(catalog_etag, catalog_last_modified)
 def view_books(request):
-    book_obj = Book.objects.all()
+    filters = catalog_filters(request.GET)
+    page = keyset_paginate(
+        Book.objects.only(*BOOK_CARD_FIELDS).filter(**filters),
+        ordering=('pk',),
+        cursor=request.GET.get('cursor'),
+        page_size=page_size_from(request, settings.CATALOG_PAGE_SIZE, settings.CATALOG_MAX_PAGE_SIZE),
+    )
     context = {
-        'books' : book_obj
+        'books'    : page,
+        'page'     : page,
+        'facets'   : facets.summary(available_only='quantity__gt' in filters),
+        'filtered' : bool(filters),
     }
     return render(request, "books.html", context)
 
-@login_required
-@user_passes_test(is_librarian)
+def search_books(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        page_number = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page_number = 1
+
+    books, has_next = [], False
+    if to_isbn13(query):
+        # an exact ISBN (either form, any hyphenation) is one index probe
+        books = list(Book.objects.by_isbn(query).only(*BOOK_CARD_FIELDS))
+    if query and not books:
+        books, has_next = ranked_search(
+            Book.objects.only(*BOOK_CARD_FIELDS),
+            query,
+            page=page_number,
+            page_size=page_size_from(request, settings.CATALOG_PAGE_SIZE, settings.CATALOG_MAX_PAGE_SIZE),
+        )
+
+    context = {
+        'books'      : books,
+        'query'      : query,
+        'page_number': page_number,
+        'has_next'   : has_next,
+    }
+    return render(request, "search_results.html", context)
+
+@librarian_required
 def view_students(request):
-    student_obj = Student.objects.all()
+    query = request.GET.get('q', '').strip()
+    year  = request.GET.get('year', '')
+    loans = request.GET.get('loans', '')
+    fees  = request.GET.get('fees', '')
+
+    students = directory.with_loan_flags(Student.objects.only(
+        'first_name', 'middle_initial', 'last_name', 'year', 'student_id', 'email',
+    ))
+    students = directory.search(students, query)
+    if year in dict(Student.YEAR_CHOICES):
+        students = students.filter(year=year)
+    if loans in ('yes', 'no'):
+        students = students.filter(has_loans=loans == 'yes')
+    if fees in ('yes', 'no'):
+        students = students.filter(has_fees=fees == 'yes')
+
+    page = keyset_paginate(
+        students,
+        ordering=('last_name', 'first_name', 'pk'),
+        cursor=request.GET.get('cursor'),
+        page_size=settings.STUDENT_DIRECTORY_PAGE_SIZE,
+    )
     context = {
-        'students' : student_obj
+        'students'     : page,
+        'query'        : query,
+        'year'         : year,
+        'loans'        : loans,
+        'fees'         : fees,
+        'year_choices' : Student.YEAR_CHOICES,
     }
     return render(request, "students.html", context)
 
 #@login_required
+@conditional_page(book_etag, book_last_modified)
 def view_book(request, book_id):
     book = get_object_or_404(Book, id=book_id)
-    borrow_records = Borrow.objects.filter(book=book)
-    is_lib = request.user.is_authenticated and is_librarian(request.user)
+    is_lib = request.role.is_librarian
+
+    # Only librarians see the loan history: one page, borrowers joined in,
+    # late fees computed by the database
+    borrow_records = None
+    if is_lib:
+        borrow_records = keyset_paginate(
+            Borrow.objects.filter(book=book)
+                          .select_related('student')
+                          .only('borrowed_at', 'returned_at', 'returned_due_date',
+                                'student__first_name', 'student__last_name')
+                          .with_late_fee(),
+            ordering=('-borrowed_at', '-pk'),
+            cursor=request.GET.get('history'),
+            page_size=settings.BORROW_HISTORY_PAGE_SIZE,
+        )
 
     already_reserved = False
     already_borrowed = False
 
-    if request.user.is_authenticated and request.user.groups.filter(name='Student').exists():
-        student = request.user.student_profile
+    if request.role.is_student:
+        student = request.role.student
         already_reserved = Reservation.objects.filter(student=student, book=book).exists()
         already_borrowed = Borrow.objects.filter(
             student=student,
@@ -63,20 +228,20 @@ def view_book(request, book_id):
         'is_librarian': is_lib,
         'already_reserved': already_reserved,
         'already_borrowed': already_borrowed,
+        'recommendations': recommendations.for_book(book.pk),
     }
 
     return render(request, "book.html", context)
 
 
-@login_required
-@user_passes_test(is_librarian)
+@librarian_required
 def new_book(request):
     if request.method == 'POST':
         form = AddBookForm(request.POST, request.FILES)  # ✅ Correct form + include FILES
         if form.is_valid():
             try:
                 form.save()
-                messages.success(request, "Book added successfully.")
+                messages.success(request, "Book added successfully. Its details will be checked against the ISBN metadata.")
                 return redirect('books')
             except Exception as e:
                 messages.error(request, f"Error: {e}")
@@ -88,24 +253,25 @@ def new_book(request):
     return render(request, 'new_book.html', {'form': form})
 
 
-@login_required
-@user_passes_test(is_student)
+@student_required
 def borrow(request, book_id):
     book    = get_object_or_404(Book, id=book_id)
-    student = request.user.student_profile
+    student = request.role.student
 
     if request.method == 'POST':
         form = BorrowForm(request.POST)
         if form.is_valid():
             want_reserve = form.cleaned_data['reserve_if_unavailable']
 
-            if book.quantity > 0:
-                try:
+            try:
+                with transaction.atomic():
+                    # free copies belong to the students already waiting
+                    if reservations.ahead_of(book.pk, student).exists():
+                        raise CopyUnavailable("Copies are held for the reservation queue.")
                     book.borrow(student=student)
-                    messages.success(request, "You have successfully borrowed this book.")
-                except ValidationError as e:
-                    messages.error(request, f"Error: {e.message if hasattr(e,'message') else e}")
-            else:
+                    Reservation.objects.filter(student=student, book=book).delete()
+                messages.success(request, "You have successfully borrowed this book.")
+            except CopyUnavailable:
                 if want_reserve:
                     Reservation.objects.get_or_create(
                         student=student,
@@ -115,6 +281,8 @@ def borrow(request, book_id):
                     messages.success(request, "No copies available—YOU have been added to the reservation queue.")
                 else:
                     messages.error(request, "Book cannot be borrowed right now.")
+            except ValidationError as e:
+                messages.error(request, f"Error: {e.message if hasattr(e,'message') else e}")
         else:
             messages.error(request, "Please correct the errors below.")
 
@@ -131,30 +299,36 @@ def borrow(request, book_id):
         'student': student,
     })
 
-@login_required
-@user_passes_test(is_student)
+@student_required
 def return_book(request, book_id):
     book = get_object_or_404(Book, id=book_id)
-    student = request.user.student_profile
+    student = request.role.student
 
     if request.method == 'POST':
         form = ReturnForm(request.POST, book=book, student=student)
         if form.is_valid():
-            borrow = form.borrow_record
-            borrow.returned_at = timezone.now()
-            borrow.save()
-            book.return_book()
-            messages.success(request, f"Book '{book.title}' returned successfully.")
+            with transaction.atomic():
+                # only the request that actually closes the loan restocks the
+                # copy; a double submit or a desk return may have beaten us
+                closed = Borrow.objects.filter(pk=form.borrow_record.pk, returned_at__isnull=True).update(
+                    returned_at=timezone.now()
+                )
+                if closed:
+                    book.return_book()
+                    dashboard.invalidate(student.pk)
+            if closed:
+                messages.success(request, f"Book '{book.title}' returned successfully.")
+            else:
+                messages.error(request, f"'{book.title}' has already been returned.")
             return redirect('books')
     else:
         form = ReturnForm(book=book, student=student)
 
     return render(request, 'return.html', {'form': form, 'book': book})
 
-@login_required
-@user_passes_test(is_student)
+@student_required
 def change_student_profile(request):
-    student = request.user.student_profile
+    student = request.role.student
     if request.method == 'POST':
         form = StudentProfileForm(request.POST, instance=student)
         if form.is_valid():
@@ -175,10 +349,9 @@ def change_student_profile(request):
         'student': student,
     })
 
-@login_required
-@user_passes_test(is_librarian)
+@librarian_required
 def change_librarian_profile(request):
-    librarian = request.user.librarian_profile
+    librarian = request.role.librarian
     if request.method == 'POST':
         form = LibrarianProfileForm(request.POST, instance=librarian)
         if form.is_valid():
@@ -199,35 +372,86 @@ def change_librarian_profile(request):
         'librarian': librarian,
     })
 
-@login_required
-@user_passes_test(is_librarian)
+@librarian_required
 def librarian_borrowed_books(request):
-    librarian = request.user.librarian_profile
-    # your model method returns all Book.objects.filter(is_borrowed=True)
-    borrowed_books = librarian.view_borrowed_books()              # :contentReference[oaicite:0]{index=0}&#8203;:contentReference[oaicite:1]{index=1}
+    """
+    Copies currently out, one row per open loan, a page at a time. With
+    ``?format=csv`` or ``json`` the same loans are streamed as a download;
+    ``since``/``until`` (borrow dates) and ``returned=1`` widen an export
+    to everything lent during a term.
+    """
+    librarian = request.role.librarian
+    student = request.GET.get('student', '').strip()
+    fmt = request.GET.get('format')
+
+    loans = librarian.view_borrowed_books()
+    if fmt in ('csv', 'json'):
+        since, until = _date_param(request, 'since'), _date_param(request, 'until')
+        if request.GET.get('returned') == '1':
+            loans = Borrow.objects.all()
+        # plain ranges on borrowed_at rather than __date lookups, which
+        # would convert every row's timestamp before comparing
+        if since:
+            loans = loans.filter(borrowed_at__gte=_start_of(since))
+        if until:
+            loans = loans.filter(borrowed_at__lt=_start_of(until + datetime.timedelta(days=1)))
+    if student.isdigit():
+        loans = loans.filter(student__student_id=int(student))
+    elif student:
+        loans = loans.filter(student__last_name__istartswith=student)
+    loans = loans.with_late_fee()
+
+    if fmt in ('csv', 'json'):
+        filename = f"loans-{timezone.now():%Y%m%d}"
+        return exports.stream(exports.loan_rows(loans.order_by('borrowed_at', 'pk')), fmt, filename)
+
+    page = keyset_paginate(
+        loans.select_related('student', 'book').only(
+            'borrowed_at', 'returned_due_date', 'returned_at',
+            'student__first_name', 'student__last_name', 'student__student_id',
+            'book__title', 'book__isbn',
+        ),
+        ordering=('-borrowed_at', '-pk'),
+        cursor=request.GET.get('cursor'),
+        page_size=settings.BORROWED_BOOKS_PAGE_SIZE,
+    )
     return render(request, 'librarian/borrowed_books.html', {
         'librarian': librarian,
-        'borrowed_books': borrowed_books,
+        'page': page,
+        'count': loans.count(),
+        'student': student,
     })
 
-@login_required
-@user_passes_test(is_librarian)
+def _date_param(request, name):
+    try:
+        return datetime.date.fromisoformat(request.GET.get(name, ''))
+    except ValueError:
+        return None
+
+def _start_of(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+@librarian_required
 def librarian_add_book(request):
-    librarian = request.user.librarian_profile
+    librarian = request.role.librarian
     if request.method == 'POST':
         form = AddBookForm(request.POST)
         if form.is_valid():
             cd = form.cleaned_data
-            librarian.add_book(                                       # :contentReference[oaicite:2]{index=2}&#8203;:contentReference[oaicite:3]{index=3}
-                title=cd['title'],
-                author=cd['author'],
-                isbn=cd['isbn'],
-                publisher=cd['publisher'],
-                year=cd['year'],
-                language=cd['language']
-            )
-            messages.success(request, "Book added to inventory.")
-            return redirect('librarian_borrowed_books')
+            try:
+                librarian.add_book(                                       # :contentReference[oaicite:2]{index=2}&#8203;:contentReference[oaicite:3]{index=3}
+                    title=cd['title'],
+                    author=cd['author'],
+                    isbn=cd['isbn'],
+                    publisher=cd['publisher'],
+                    year=cd['year'],
+                    language=cd['language']
+                )
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                messages.success(request, "Book added to inventory. Its details will be checked against the ISBN metadata.")
+                return redirect('librarian_borrowed_books')
     else:
         form = AddBookForm()
     return render(request, 'librarian/add_book.html', {
@@ -235,10 +459,9 @@ def librarian_add_book(request):
         'librarian': librarian,
     })
 
-@login_required
-@user_passes_test(is_librarian)
+@librarian_required
 def librarian_remove_book(request):
-    librarian = request.user.librarian_profile
+    librarian = request.role.librarian
     if request.method == 'POST':
         form = RemoveBookForm(request.POST)
         if form.is_valid():
@@ -256,22 +479,136 @@ def librarian_remove_book(request):
         'librarian': librarian,
     })
 
-@login_required
-@user_passes_test(is_student)
+@student_required
 def student_dashboard(request):
-    student = request.user.student_profile
-    borrowed_books = Borrow.objects.filter(student=student).order_by('-borrowed_at')
+    # The summary is cached per student; the history is one page at a time,
+    # so neither gets slower as the student borrows more over the years
+    student_id = request.role.student_id
+    history = keyset_paginate(
+        Borrow.objects.filter(student_id=student_id)
+                      .select_related('book')
+                      .only('borrowed_at', 'returned_at', 'returned_due_date', 'book__title')
+                      .with_late_fee(),
+        ordering=('-borrowed_at', '-pk'),
+        cursor=request.GET.get('cursor'),
+        page_size=settings.STUDENT_HISTORY_PAGE_SIZE,
+    )
 
     context = {
-        'borrowed_books': borrowed_books,
-        'student': student,
+        'summary': dashboard.summary(student_id),
+        'history': history,
     }
     return render(request, 'student_dashboard.html', context)
 
-@login_required
-@user_passes_test(is_librarian)
+@librarian_required
+def librarian_circulation(request):
+    """
+    Desk check-out/return of many books for one student at once. Accepts
+    the form or a JSON body with the same fields (``items`` as a list) and
+    answers JSON callers with the per-item results.
+    """
+    wants_json = request.content_type == 'application/json'
+    if request.method == 'POST':
+        data = request.POST
+        if wants_json:
+            try:
+                data = json.loads(request.body)
+                data['items'] = '\n'.join(str(i) for i in data.get('items', []))
+            except (ValueError, AttributeError):
+                return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+        form = BulkCirculationForm(data)
+        if form.is_valid():
+            run = circulation.bulk_checkout if form.cleaned_data['action'] == 'checkout' else circulation.bulk_return
+            results = run(form.student, form.cleaned_data['items'])
+            if wants_json:
+                return JsonResponse({'results': results})
+            return render(request, 'librarian/circulation.html', {
+                'form': BulkCirculationForm(initial={'action': form.cleaned_data['action']}),
+                'results': results,
+                'student': form.student,
+            })
+        if wants_json:
+            return JsonResponse({'errors': form.errors}, status=400)
+    else:
+        form = BulkCirculationForm()
+    return render(request, 'librarian/circulation.html', {'form': form})
+
+@librarian_required
+def librarian_overdue(request):
+    try:
+        min_days = max(1, int(request.GET.get('min_days', 1)))
+    except ValueError:
+        min_days = 1
+    student = request.GET.get('student', '').strip()
+
+    loans = Borrow.objects.overdue(min_days)
+    if student.isdigit():
+        loans = loans.filter(student__student_id=int(student))
+    elif student:
+        loans = loans.filter(student__last_name__istartswith=student)
+    loans = loans.with_late_fee()
+
+    summary = loans.aggregate(count=Count('pk'), total_fees=Sum('late_fee'))
+    page = keyset_paginate(
+        loans.select_related('student', 'book').only(
+            'borrowed_at', 'returned_due_date', 'returned_at',
+            'student__first_name', 'student__last_name', 'student__student_id',
+            'book__title', 'book__isbn',
+        ),
+        ordering=('returned_due_date', 'pk'),
+        cursor=request.GET.get('cursor'),
+        page_size=settings.OVERDUE_PAGE_SIZE,
+    )
+    return render(request, 'librarian/overdue.html', {
+        'page': page,
+        'summary': summary,
+        'min_days': min_days,
+        'student': student,
+    })
+
+@librarian_required
+def librarian_metadata_review(request):
+    """Books whose details disagree with their ISBN metadata."""
+    if request.method == 'POST':
+        book = get_object_or_404(Book, pk=request.POST.get('book_id'))
+        if request.POST.get('action') == 'accept':
+            verification.accept(book.pk)
+            messages.success(request, f"Accepted the details of “{book.title}” as entered.")
+        else:
+            verification.recheck(book.pk)
+            messages.info(request, f"“{book.title}” will be checked again.")
+        return redirect('librarian_metadata_review')
+
+    page = keyset_paginate(
+        Book.objects.filter(metadata_status='mismatch').only(
+            'title', 'author', 'isbn', 'publisher', 'year', 'metadata_problems', 'metadata_checked_at',
+        ),
+        ordering=('pk',),
+        cursor=request.GET.get('cursor'),
+        page_size=settings.METADATA_REVIEW_PAGE_SIZE,
+    )
+    return render(request, 'librarian/metadata_review.html', {
+        'page': page,
+        'pending': Book.objects.filter(metadata_status='pending').count(),
+    })
+
+@librarian_required
+def cache_stats(request):
+    return JsonResponse({'book_cards': cards.stats(), 'isbn_metadata': metadata.stats()})
+
+@librarian_required
 def librarian_dashboard(request):
-    return render(request, 'librarian_dashboard.html')
+    # figures come from the rollups kept by the rollup_circulation command
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    if days not in analytics.WINDOWS:
+        days = 30
+    return render(request, 'librarian_dashboard.html', {
+        'analytics': analytics.summary(days),
+        'windows': analytics.WINDOWS,
+    })
 
 
 def register(request):
@@ -345,15 +682,16 @@ class CustomLoginView(LoginView):
     template_name = 'login.html'    # our custom template
 
     def get_success_url(self):
-        user = self.request.user
-        if user.groups.filter(name='Student').exists():
+        # request.role may have been read before login(); resolve it afresh
+        role = get_role(self.request)
+        if role.is_student:
             return reverse('student_dashboard')  # Change to your student dashboard URL
-        elif user.groups.filter(name='Librarian').exists():
+        elif role.is_librarian:
             return reverse('librarian_dashboard')  # Librarian's default dashboard
         else:
             return '/'  # fallback to home
 
     def dispatch(self, request, *args, **kwargs):
         if request.user.is_authenticated:
-            return redirect('student_dashboard' if is_student(request.user) else 'librarian_dashboard')
+            return redirect('student_dashboard' if request.role.is_student else 'librarian_dashboard')
         return super().dispatch(request, *args, **kwargs)
\ No newline at end of file